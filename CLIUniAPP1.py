@@ -1,154 +1,7 @@
-import random
-
-class Subject:
-    def __init__(self):
-        self.id = self.generate_id()
-        self.score = random.randint(25, 100)
-        self.grade = self.determine_grade()
-
-    def generate_id(self):
-        return str(random.randint(1, 999)).zfill(3)
-
-    def determine_grade(self):
-        if self.score < 50:
-            return 'Z'
-        elif 50 <= self.score < 65:
-            return 'P'
-        elif 65 <= self.score < 75:
-            return 'C'
-        elif 75 <= self.score < 85:
-            return 'D'
-        elif self.score >= 85:
-            return 'HD'
-
-    def __str__(self):
-        return f"Subject ID: {self.id}, Score: {self.score}, Grade: {self.grade}"
-
-class Student:
-    def __init__(self, name, email, password):
-        self.id = self.generate_id()
-        self.name = name
-        self.email = email
-        self.password = password
-        self.subjects = []
-
-    def generate_id(self):
-        return str(random.randint(1, 999999)).zfill(6)
-
-    def register_subject(self):
-        if len(self.subjects) < 4:
-            new_subject = Subject()
-            self.subjects.append(new_subject)
-            print(f"Registered subject: {new_subject}")
-        else:
-            print(f"\033[31mStudent are allowed to enrol in 4 subjects only.\033[0m")
-
-    def drop_subject(self, subject_id):
-        original_length = len(self.subjects)
-        self.subjects = [subject for subject in self.subjects if subject.id != subject_id]
-        return len(self.subjects) < original_length
-
-    def list_subjects(self):
-        for subject in self.subjects:
-            print(subject)
-
-    def change_password(self, new_password):
-        self.password = new_password
-
-    def __str__(self):
-        return f"Student ID: {self.id}, Name: {self.name}, Email: {self.email}, Subjects: {[str(subject) for subject in self.subjects]}"
-
-import pickle
-import os
-import threading
-
-class Database:
-    def __init__(self, filename='students.data'):
-        self.filename = filename
-        self.lock = threading.Lock()
-        self.check_file_exists()
-
-    def initialize_file(self):
-        self.lock.acquire()
-        try:
-            if not os.path.exists(self.filename):
-                with open(self.filename, 'wb') as file:
-                    pickle.dump([], file)  
-        finally:
-            self.lock.release()
-
-    def check_file_exists(self):
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'wb') as file:
-                pickle.dump([], file)
-
-    def email_exists(self, email):
-        try:
-            self.check_file_exists()
-            with open(self.filename, 'rb') as file:
-                students = pickle.load(file)
-                return any(student.email == email for student in students)
-        except Exception as e:
-            print(f"Error reading from file: {e}")
-            return False
-
-    def write_student(self, student):
-        self.lock.acquire()  
-        try:
-            with open(self.filename, 'rb+') as file:
-                students = pickle.load(file)
-                students = [s for s in students if s.id != student.id]
-                students.append(student)
-                file.seek(0)
-                file.truncate()
-                pickle.dump(students, file)
-        except Exception as e:
-            print(f"Error writing to file: {e}")
-        finally:
-            self.lock.release()  
-
-
-    def read_students(self):
-        with self.lock: 
-            try:
-                with open(self.filename, 'rb') as file:
-                    return pickle.load(file)
-            except Exception as e:
-                print(f"Error reading from file: {e}")
-                return []  
-
-
-    def delete_student(self, student_id):
-        try:
-            self.check_file_exists()
-            with open(self.filename, 'rb+') as file:
-                students = pickle.load(file)
-                new_students = [student for student in students if student.id != student_id]
-                if len(students) == len(new_students):
-                    return False
-                file.seek(0)
-                file.truncate()
-                pickle.dump(new_students, file)
-                return True
-        except Exception as e:
-            print(f"Error deleting student: {e}")
-            return False
-
-    def clear_students(self):
-     confirm = input("Are you sure you want to clear all student data? Type 'yes' to confirm: ")
-     if confirm.lower() == 'yes':
-        self.lock.acquire()  
-        try:
-            with open(self.filename, 'wb') as file:
-                pickle.dump([], file)  
-            print("All student data has been successfully cleared.")
-        except Exception as e:
-            print(f"Error clearing student data: {e}")
-        finally:
-            self.lock.release() 
-     else:
-        print("Operation cancelled.")
+import argparse
 
+from uniapp import GRADES, Student, Subject, close_databases, shared_database
+from uniapp.writebehind import DURABILITY_MODES, WriteBehindCache
 
 def main_menu():
     print("\n\033[36mWelcome to CLIUniApp\033[0m")
@@ -180,20 +33,21 @@ def admin_menu():
     print("\n\033[36mAdmin Menu\033[0m")
     print("\033[36m(C) Clear Database\033[0m")
     print("\033[36m(G) Group Students by Grade\033[0m")
+    print("\033[36m(M) Show Metrics\033[0m")
     print("\033[36m(P) Partition Students by Pass/Fail\033[0m")
+    print("\033[36m(Q) Query Students\033[0m")
     print("\033[36m(R) Remove Student\033[0m")
     print("\033[36m(S) Show All Students\033[0m")
+    print("\033[36m(U) Restore Snapshot\033[0m")
     print("\033[36m(X) Exit\033[0m")
     choice = input("\033[36mYour choice: \033[0m").upper()
     return choice
 
-import re
-
-def valid_email(email):
-    return re.match(r'^[a-zA-Z0-9._]*[a-zA-Z0-9]+\.[a-zA-Z0-9]+@[a-zA-Z0-9._]+\.[a-zA-Z]{2,}$', email) and email.endswith('@university.com')
-
-def valid_password(password):
-    return re.match(r'^[A-Z][a-zA-Z]{4,}[0-9]{3,}$', password)
+from itertools import islice
+from uniapp import metrics, passwords
+from uniapp.query import ORDERS, parse_range
+from uniapp.reports import page, report_students, write_paged
+from uniapp.validation import EMAIL_PATTERN, PASSWORD_PATTERN, valid_email, valid_password
 
 def handle_student_registration(database):
     print("\n\033[32mRegister New Student\033[0m")
@@ -210,17 +64,22 @@ def handle_student_registration(database):
         print(f"\033[31mA student {name} already exists.\033[0m")
         return
 
-    student = Student(name, email, password)
-    database.write_student(student)
+    student = Student(name, email, passwords.hasher.hash(password))
+    if not database.register_student(student):
+        print(f"\033[31mA student {name} already exists.\033[0m")
+        return
     print("Registration successful!")
 
 def handle_enroll_subject(student, database):
     if len(student.subjects) >= 4:
         print(f"\033[31mYou have already enrolled in 4 subjects.\033[0m")
         return
-    student.register_subject()
-    database.write_student(student)
-    print("Subject enrolled successfully.")
+    new_subject = Subject()
+    if database.modify_student(student, lambda current: current.add_subject(new_subject)):
+        print(f"Registered subject: {new_subject}")
+        print("Subject enrolled successfully.")
+    else:
+        print(f"\033[31mStudent are allowed to enrol in 4 subjects only.\033[0m")
 
 def handle_drop_subject(student, database):
     if not student.subjects:
@@ -229,8 +88,7 @@ def handle_drop_subject(student, database):
 
     student.list_subjects()
     subject_id = input("Enter subject ID to drop: ")
-    if student.drop_subject(subject_id):
-        database.write_student(student)
+    if database.modify_student(student, lambda current: current.drop_subject(subject_id)):
         print("Subject dropped successfully.")
     else:
         print(f"No subject found with ID: {subject_id}")
@@ -245,8 +103,9 @@ def handle_change_password(student, database):
         print(f"\033[31mPasswords do not match - Try again.\033[0m")
         confirm_password = input("Confirm new password: ")
 
-    student.change_password(new_password)
-    database.write_student(student)
+    # Hashed once here, so a replayed change stores the same hash.
+    password_hash = passwords.hasher.hash(new_password)
+    database.modify_student(student, lambda current: current.change_password(password_hash))
     print("Password changed successfully.")
 
 
@@ -256,7 +115,10 @@ def handle_show_subjects(student):
     else:
         student.list_subjects()
 
-def handle_clear_database(database):
+def handle_clear_database(database, confirmed=False):
+    if confirmed:
+        database.clear_students(ask=False)
+        return
     confirm = input(f"\033[31mAre you sure you want to clear all student data? Type 'yes' to confirm:\033[0m")
     if confirm.lower() == 'yes':
         database.clear_students()
@@ -264,117 +126,286 @@ def handle_clear_database(database):
     else:
         print("Operation cancelled.")
 
-def handle_group_students_by_grade(database):
-    students = database.read_students()
-    grade_groups = {'Z': {}, 'P': {}, 'C': {}, 'D': {}, 'HD': {}}
-
-    for student in students:
-        student_info = f"{student.name}: {student.id} --> Email: {student.email}"
-        student_subjects_by_grade = {grade: [] for grade in grade_groups.keys()}
-
-        for subject in student.subjects:
-            subject_info = f"Subject ID: {subject.id}, Score: {subject.score}, Grade: {subject.grade}"
-            if subject_info not in student_subjects_by_grade[subject.grade]:
-                student_subjects_by_grade[subject.grade].append(subject_info)
-
-        for grade, subjects in student_subjects_by_grade.items():
-            if subjects:
-                if student.id not in grade_groups[grade]:
-                    grade_groups[grade][student.id] = {
-                        "info": student_info,
-                        "subjects": subjects
-                    }
-                else:
-                    grade_groups[grade][student.id]["subjects"].extend(subjects)
-                    grade_groups[grade][student.id]["subjects"] = list(set(grade_groups[grade][student.id]["subjects"]))
-
-    for grade, students in grade_groups.items():
+def handle_list_snapshots(database):
+    names = database.snapshot_names()
+    if not names:
+        print("No snapshots yet.")
+    for number, name in enumerate(reversed(names), 1):
+        print(f"({number}) {name}")
+    return names[::-1]
+
+def handle_restore_snapshot(database, name=None):
+    if name is None:
+        names = handle_list_snapshots(database)
+        if not names:
+            return
+        choice = input("Restore which snapshot? [1]: ") or '1'
+        if not choice.isdigit() or not 1 <= int(choice) <= len(names):
+            print(f"\033[31mNo snapshot {choice}.\033[0m")
+            return
+        name = names[int(choice) - 1]
+        confirm = input(f"\033[31mReplace all student data with snapshot {name}? Type 'yes' to confirm:\033[0m")
+        if confirm.lower() != 'yes':
+            print("Operation cancelled.")
+            return
+    if name not in database.snapshot_names():
+        print(f"\033[31mNo snapshot named {name}.\033[0m")
+    elif database.restore_snapshot(name):
+        print(f"Restored snapshot {name}.")
+
+def grade_lines(database, code, offset=0, limit=None):
+    for student in report_students(database, lambda aggregates: aggregates.grade_students[code], offset, limit):
+        subjects_str = ', '.join(dict.fromkeys(str(subject) for subject in student.subjects if subject.grade_code == code))
+        yield f"{student.name}: {student.id} --> Email: {student.email}, Subjects: [{subjects_str}]"
+
+@metrics.timed('report.grades')
+def handle_group_students_by_grade(database, limit=None, offset=0, page_size=None):
+    for code, grade in enumerate(GRADES):
         print(f"\nStudents with Grade {grade}:")
-        for student_details in students.values():
-            subjects_str = ', '.join(student_details["subjects"])
-            print(f"{student_details['info']}, Subjects: [{subjects_str}]")
-
-def handle_partition_students_by_pass_fail(database):
-    students = database.read_students()
-    pass_students = {}
-    fail_students = {}
-
-    for student in students:
-        student_info = f"Student ID: {student.id}, Name: {student.name}, Email: {student.email}"
-        subjects_list = [f"Subject ID: {sub.id}, Score: {sub.score}, Grade: {sub.grade}" for sub in student.subjects]
-
-        if student.subjects:
-            average_score = sum(sub.score for sub in student.subjects) / len(student.subjects)
-            if average_score >= 50:
-                pass_students[student.id] = {
-                    "info": student_info,
-                    "subjects": subjects_list,
-                    "Average Score": average_score
-                }
-            else:
-                fail_students[student.id] = {
-                    "info": student_info,
-                    "subjects": subjects_list,
-                    "Average Score": average_score
-                }
-        else:
-            fail_students[student.id] = {
-                "info": student_info,
-                "subjects": subjects_list,
-                "Average Score": "No subjects registered"
-            }
-
+        if write_paged(grade_lines(database, code, offset, limit), page_size) is None:
+            return
+
+def average_line(student):
+    student_info = f"Student ID: {student.id}, Name: {student.name}, Email: {student.email}"
+    if student.subjects:
+        average = sum(subject.score for subject in student.subjects) / len(student.subjects)
+        return f"{student_info}, Average Score: {average:.2f}, Subjects: {[str(subject) for subject in student.subjects]}"
+    return f"{student_info}, No subjects registered, Subjects: []"
+
+def pass_fail_lines(database, passed, offset=0, limit=None):
+    select = (lambda aggregates: aggregates.passing) if passed else (lambda aggregates: aggregates.failing)
+    for student in report_students(database, select, offset, limit):
+        yield average_line(student)
+
+@metrics.timed('report.pass_fail')
+def handle_partition_students_by_pass_fail(database, limit=None, offset=0, page_size=None):
     print("\nStudents who Passed:")
-    for student in pass_students.values():
-        print(f"{student['info']}, Average Score: {student['Average Score']:.2f}, Subjects: {student['subjects']}")
+    if write_paged(pass_fail_lines(database, True, offset, limit), page_size) is None:
+        return
 
     print("\nStudents who Failed:")
-    for student in fail_students.values():
-        print(
-            f"{student['info']}, Average Score: {student['Average Score']:.2f}, Subjects: {student['subjects']}" if isinstance(
-                student['Average Score'],
-                float) else f"{student['info']}, {student['Average Score']}, Subjects: {student['subjects']}")
-
-def handle_show_all_students(database):
-    students = database.read_students()
-    shown_students = set()
-    if not students:
+    write_paged(pass_fail_lines(database, False, offset, limit), page_size)
+
+@metrics.timed('report.all_students')
+def handle_show_all_students(database, limit=None, offset=0, page_size=None):
+    lines = (f"Name: {student.name}, ID: {student.id}, Email: {student.email}" for student in database.iter_students())
+    if write_paged(page(lines, offset, limit), page_size) == 0 and offset == 0:
         print("No students registered.")
-    else:
-        for student in students:
-            if student.id not in shown_students:
-                print(f"Name: {student.name}, ID: {student.id}, Email: {student.email}")
-                shown_students.add(student.id)
 
-def handle_remove_student(database):
-    student_id = input("Enter student ID to remove: ")
+def handle_show_metrics():
+    if not metrics.enabled:
+        print("Metrics are off; start CLIUniApp with --metrics or --profile to collect them.")
+        return
+    for line in metrics.report_lines():
+        print(line)
+
+def query_filters(grade=None, score=None, average=None, domain=None, subjects=None, order=None):
+    # Database.query keywords from the CLI's answers; ranges are "low-high",
+    # "low-", "-high" or one value, and blank answers leave a filter out.
+    filters = {'grade': grade.upper() if grade else None, 'domain': domain or None, 'order_by': order or None}
+    for name, text, convert in (('score', score, int), ('average', average, float), ('subjects', subjects, int)):
+        if text:
+            filters[f'min_{name}'], filters[f'max_{name}'] = parse_range(text, convert)
+    return filters
+
+def ask_query_filters():
+    print("Leave any question blank to skip it.")
+    return query_filters(grade=input(f"Grade ({'/'.join(reversed(GRADES))}): ").strip(),
+                         score=input("Any subject score in range (e.g. 85-100): "),
+                         average=input("Average score in range (e.g. 75-): "),
+                         domain=input("Email domain: ").strip(),
+                         subjects=input("Number of subjects in range (e.g. 1-2): "),
+                         order=input(f"Order by ({', '.join(order for order in ORDERS if order)}): ").strip())
+
+@metrics.timed('report.query')
+def handle_query_students(database, filters=None, limit=None, offset=0, page_size=None):
+    try:
+        filters = ask_query_filters() if filters is None else filters
+        students = database.query(offset=offset, limit=limit, **filters)
+    except ValueError as error:
+        print(f"\033[31m{error}\033[0m")
+        return
+    if write_paged(map(average_line, students), page_size) == 0:
+        print("No students match.")
+
+def handle_remove_student(database, student_id=None):
+    if student_id is None:
+        student_id = input("Enter student ID to remove: ")
     if database.delete_student(student_id):
         print(f"\033[33mRemoving Student {student_id} Account\033[0m")
     else:
         print(f"\033[31mstudent {student_id} does not exist\033[0m")
 
+IMPORT_BATCH_SIZE = 10000
+EXPORT_FIELDS = ('id', 'name', 'email', 'password', 'subjects')
+
+def file_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+def read_rows(path, fmt):
+    # Rows as the file has them; student_from_row checks them. A JSONL
+    # line that does not parse is passed on as None.
+    import csv
+    import json
+    with open(path, newline='', encoding='utf-8') as file:
+        if fmt == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        yield None
+
+def subjects_from_row(subjects):
+    # "id:score;id:score" from CSV, [{"id": .., "score": ..}] from JSONL.
+    if isinstance(subjects, str):
+        pairs = [item.split(':') for item in subjects.split(';') if item]
+    else:
+        pairs = [(subject['id'], subject['score']) for subject in subjects]
+    if len(pairs) > 4:
+        raise ValueError("more than 4 subjects")
+    numbers = set()
+    restored = []
+    for number, score in pairs:
+        number, score = int(number), int(score)
+        if not 1 <= number <= 999:
+            raise ValueError(f"subject id {number} out of range")
+        if not 0 <= score <= 100:
+            raise ValueError(f"score {score} out of range")
+        if number in numbers:
+            raise ValueError("duplicate subject id")
+        numbers.add(number)
+        restored.append(Subject.restore(number, score))
+    return restored
+
+def student_from_row(row):
+    # Raises KeyError, TypeError or ValueError for a row that cannot be a
+    # student: not an object, fields that are not text, or subjects the
+    # app would never give out.
+    if not isinstance(row, dict):
+        raise TypeError("not an object")
+    fields = [row.get(name) or '' for name in ('id', 'name', 'email', 'password')]
+    if not all(isinstance(value, str) for value in fields):
+        raise TypeError("fields must be text")
+    student = Student.__new__(Student)
+    student.id, student.name, student.email, student.password = fields
+    student.id = student.id or None
+    student.subjects = subjects_from_row(row.get('subjects') or '')
+    return student
+
+def validated_students(rows, database, stats):
+    # Validates and de-duplicates a batch at a time; emails already stored
+    # or seen earlier in the file are skipped, never overwritten.
+    seen_emails = set()
+    seen_ids = set()
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, IMPORT_BATCH_SIZE))
+        if not batch:
+            return
+        students = []
+        for row in batch:
+            try:
+                students.append(student_from_row(row))
+            except (KeyError, TypeError, ValueError):
+                stats['invalid row'] += 1
+        # Ids generated for rows without one must not take an id that a
+        # row of this batch brings along.
+        database.ids.advance(max((int(student.id) for student in students if (student.id or '').isdigit()), default=0))
+        accepted = []
+        for student in students:
+            email = student.email
+            if not (EMAIL_PATTERN.match(email) and email.endswith('@university.com')):
+                stats['invalid email'] += 1
+                continue
+            if not (passwords.is_hash(student.password) or PASSWORD_PATTERN.match(student.password)):
+                stats['invalid password'] += 1
+                continue
+            if email in seen_emails or database.email_exists(email):
+                stats['duplicate email'] += 1
+                continue
+            if student.id is None:
+                student.id = database.new_student_id()
+            elif student.id in seen_ids or database.id_exists(student.id):
+                stats['duplicate id'] += 1
+                continue
+            seen_emails.add(email)
+            seen_ids.add(student.id)
+            accepted.append(student)
+        # Plaintext passwords are hashed a batch at a time on the pool;
+        # hashes (e.g. from an export) are kept as they are.
+        plain = [student for student in accepted if not passwords.is_hash(student.password)]
+        for student, password_hash in zip(plain, passwords.hasher.hash_many(student.password for student in plain)):
+            student.password = password_hash
+        yield from accepted
+
+def handle_import(database, path, fmt=None):
+    # csv is only needed here and in export.
+    import csv
+    stats = {'invalid row': 0, 'invalid email': 0, 'invalid password': 0, 'duplicate email': 0, 'duplicate id': 0}
+    try:
+        rows = read_rows(path, file_format(path, fmt))
+        imported = database.import_students(validated_students(rows, database, stats))
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        print(f"\033[31mImport failed: {e}\033[0m")
+        return
+    skipped = ', '.join(f"{count} {reason}" for reason, count in stats.items() if count)
+    print(f"Imported {imported} students" + (f", skipped {skipped}." if skipped else "."))
+
+def handle_export(database, path, fmt=None):
+    import csv
+    import json
+    fmt = file_format(path, fmt)
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(EXPORT_FIELDS)
+        for student in database.iter_students():
+            if writer:
+                subjects = ';'.join(f"{subject.id}:{subject.score}" for subject in student.subjects)
+                writer.writerow((student.id, student.name, student.email, student.password, subjects))
+            else:
+                subjects = [{'id': subject.id, 'score': subject.score} for subject in student.subjects]
+                file.write(json.dumps({'id': student.id, 'name': student.name, 'email': student.email,
+                                       'password': student.password, 'subjects': subjects}) + '\n')
+            count += 1
+    print(f"Exported {count} students to {path}.")
+
+def handle_check_aggregates(database, repair=False):
+    found = database.check_aggregates(repair)
+    if not found:
+        print("Report aggregates are consistent.")
+        return
+    for difference in found:
+        print(f"\033[31m{difference}\033[0m")
+    print("Rebuilt the report aggregates." if repair else "Run with --repair to rebuild them.")
+
+def handle_convert_file(database):
+    count = database.convert_file()
+    print(f"Converted {count} students in {database.filename} to the binary record format.")
+
 def handle_student_login(database):
     print(f"\n\033[32mStudent Login\033[0m")
     email = input("Enter email: ")
     password = input("Enter password: ")
-    students = database.read_students()
-    found = False
-    for student in students:
-        if student.email == email:
-            found = True
-            if student.password == password:
-                return student
-            else:
-                break
+    student = database.get_by_email(email)
+    if student is not None and passwords.verify_student(database, student, password):
+        return student
 
-    if found:
+    if student is not None:
         print(f"\033[31mLogin failed! Incorrect password.\033[0m")
     else:
         print(f"\033[31mStudent does not exist\033[0m")
     return None
 
-def run():
-    db = Database()
+def run(limit=None, offset=0, page_size=None, durability='batch'):
+    db = shared_database()
+    paging = {'limit': limit, 'offset': offset, 'page_size': page_size}
     while True:
         choice = main_menu()
         if choice == 'A':
@@ -383,13 +414,19 @@ def run():
                 if admin_choice == 'C':
                     handle_clear_database(db)
                 elif admin_choice == 'G':
-                    handle_group_students_by_grade(db)
+                    handle_group_students_by_grade(db, **paging)
+                elif admin_choice == 'M':
+                    handle_show_metrics()
                 elif admin_choice == 'P':
-                    handle_partition_students_by_pass_fail(db)
+                    handle_partition_students_by_pass_fail(db, **paging)
+                elif admin_choice == 'Q':
+                    handle_query_students(db, **paging)
                 elif admin_choice == 'R':
                     handle_remove_student(db)
                 elif admin_choice == 'S':
-                    handle_show_all_students(db)
+                    handle_show_all_students(db, **paging)
+                elif admin_choice == 'U':
+                    handle_restore_snapshot(db)
                 elif admin_choice == 'X':
                     break  
         elif choice == 'S':
@@ -398,18 +435,23 @@ def run():
                 if student_choice == 'L':
                     student = handle_student_login(db)
                     if student:
-                        while True:
-                            sc_choice = student_course_menu(student)
-                            if sc_choice == 'C':
-                                handle_change_password(student, db)
-                            elif sc_choice == 'E':
-                                handle_enroll_subject(student, db)
-                            elif sc_choice == 'R':
-                                handle_drop_subject(student, db)
-                            elif sc_choice == 'S':
-                                handle_show_subjects(student)
-                            elif sc_choice == 'X':
-                                break  
+                        # Session changes are batched and written on logout.
+                        session = WriteBehindCache(db, durability)
+                        try:
+                            while True:
+                                sc_choice = student_course_menu(student)
+                                if sc_choice == 'C':
+                                    handle_change_password(student, session)
+                                elif sc_choice == 'E':
+                                    handle_enroll_subject(student, session)
+                                elif sc_choice == 'R':
+                                    handle_drop_subject(student, session)
+                                elif sc_choice == 'S':
+                                    handle_show_subjects(student)
+                                elif sc_choice == 'X':
+                                    break  
+                        finally:
+                            session.close()
                 elif student_choice == 'R':
                     handle_student_registration(db)
                 elif student_choice == 'X':
@@ -419,5 +461,114 @@ def run():
             break 
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CLIUniApp")
+    parser.add_argument('--limit', type=int, default=None, help="show at most this many rows per report section")
+    parser.add_argument('--offset', type=int, default=0, help="skip this many rows per report section")
+    parser.add_argument('--page-size', type=int, default=None, help="pause after this many rows")
+    parser.add_argument('--durability', choices=DURABILITY_MODES, default='batch',
+                        help="when student session changes reach the disk")
+    parser.add_argument('--password-cost', type=int, default=None,
+                        help="scrypt n (or PBKDF2 iterations) for newly hashed passwords")
+    parser.add_argument('--metrics', action='store_true', help="collect latency histograms and I/O counters")
+    parser.add_argument('--profile', metavar='PATH', default=None,
+                        help="write cProfile stats to PATH, or flame graph stacks if it ends in .folded")
+    # The report commands also take the paging options after their name;
+    # SUPPRESS keeps them from resetting values given before it.
+    paging = argparse.ArgumentParser(add_help=False)
+    paging.add_argument('--limit', type=int, default=argparse.SUPPRESS, help="show at most this many rows per report section")
+    paging.add_argument('--offset', type=int, default=argparse.SUPPRESS, help="skip this many rows per report section")
+    paging.add_argument('--page-size', type=int, default=argparse.SUPPRESS, help="pause after this many rows")
+    commands = parser.add_subparsers(dest='command')
+    for name, help_text in (('import', "load students from a CSV or JSONL file"),
+                            ('export', "write all students to a CSV or JSONL file")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('path')
+        command.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                             help="defaults to the file extension")
+    command = commands.add_parser('check', help="verify the report aggregates against the students")
+    command.add_argument('--repair', action='store_true', help="replace them with a fresh rebuild")
+    commands.add_parser('snapshots', help="list the kept copies of students.data, newest first")
+    command = commands.add_parser('restore', help="put students.data back as it was in a snapshot")
+    command.add_argument('name', nargs='?', default=None, help="defaults to asking which")
+    command = commands.add_parser('serve', help="answer the JSON API over HTTP on localhost")
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8765)
+    command.add_argument('--workers', type=int, default=8, help="threads running Database calls")
+    commands.add_parser('convert', help="rewrite students.data from pickled records to the binary format")
+    # The admin menu's actions, for scripts and cron: nothing is asked.
+    for name, help_text in (('grades', "group students by grade"),
+                            ('pass-fail', "partition students by pass/fail"),
+                            ('students', "show all students")):
+        commands.add_parser(name, parents=[paging], help=f"{help_text}, using --limit, --offset and --page-size")
+    command = commands.add_parser('remove', help="remove a student")
+    command.add_argument('student_id')
+    command = commands.add_parser('clear', help="remove every student (kept as a snapshot)")
+    command.add_argument('--yes', action='store_true', required=True, help="confirm; required")
+    command = commands.add_parser('query', parents=[paging], help="list the students matching filters, using --limit and --offset")
+    command.add_argument('--grade', choices=GRADES, default=None, help="holds this grade in some subject")
+    command.add_argument('--score', default=None, help="scored in range LOW-HIGH in some subject")
+    command.add_argument('--average', default=None, help="average score in range LOW-HIGH")
+    command.add_argument('--domain', default=None, help="email domain")
+    command.add_argument('--subjects', default=None, help="number of subjects in range LOW-HIGH")
+    command.add_argument('--order', choices=[order for order in ORDERS if order], default=None,
+                         help="highest average first with --order=-average")
+    return parser.parse_args(argv)
+
+
+def main(args):
+    try:
+        dispatch(args)
+    finally:
+        close_databases()
+
+
+def dispatch(args):
+    paging = {'limit': args.limit, 'offset': args.offset, 'page_size': args.page_size}
+    if args.command == 'import':
+        handle_import(shared_database(), args.path, args.format)
+    elif args.command == 'export':
+        handle_export(shared_database(), args.path, args.format)
+    elif args.command == 'check':
+        handle_check_aggregates(shared_database(), args.repair)
+    elif args.command == 'snapshots':
+        handle_list_snapshots(shared_database())
+    elif args.command == 'restore':
+        handle_restore_snapshot(shared_database(), args.name)
+    elif args.command == 'serve':
+        from uniapp.server import serve
+        serve(shared_database(), args.host, args.port, args.workers)
+    elif args.command == 'convert':
+        handle_convert_file(shared_database())
+    elif args.command == 'grades':
+        handle_group_students_by_grade(shared_database(), **paging)
+    elif args.command == 'pass-fail':
+        handle_partition_students_by_pass_fail(shared_database(), **paging)
+    elif args.command == 'students':
+        handle_show_all_students(shared_database(), **paging)
+    elif args.command == 'remove':
+        handle_remove_student(shared_database(), args.student_id)
+    elif args.command == 'clear':
+        handle_clear_database(shared_database(), confirmed=args.yes)
+    elif args.command == 'query':
+        try:
+            filters = query_filters(args.grade, args.score, args.average, args.domain, args.subjects, args.order)
+        except ValueError as error:
+            print(f"\033[31mInvalid range: {error}\033[0m")
+            return
+        handle_query_students(shared_database(), filters, **paging)
+    else:
+        run(durability=args.durability, **paging)
+
+
 if __name__ == "__main__":
-    run()
+    args = parse_args()
+    if args.password_cost:
+        passwords.configure(cost=args.password_cost)
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        with metrics.profiled(args.profile):
+            main(args)
+    else:
+        main(args)
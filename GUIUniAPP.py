@@ -1,69 +1,108 @@
 import tkinter as tk
-from tkinter import messagebox
-import pickle
-import os
-import random
-import tkinter.simpledialog
-
-class Subject:
-    def __init__(self):
-        self.id = self.generate_id()
-        self.score = random.randint(25, 100)
-        self.grade = self.determine_grade()
-
-    def generate_id(self):
-        return str(random.randint(1, 999)).zfill(3)
-
-    def determine_grade(self):
-        if self.score < 50:
-            return 'Z'
-        elif 50 <= self.score < 65:
-            return 'P'
-        elif 65 <= self.score < 75:
-            return 'C'
-        elif 75 <= self.score < 85:
-            return 'D'
-        elif self.score >= 85:
-            return 'HD'
-
-    def __str__(self):
-        return f"Subject ID: {self.id}, Score: {self.score}, Grade: {self.grade}"
-
-class Student:
-    def __init__(self, name, email, password):
-        self.id = str(random.randint(1, 999999)).zfill(6)
-        self.name = name
-        self.email = email
-        self.password = password
-        self.subjects = []
-
-class Database:
-    def __init__(self, filename='students.data'):
-        self.filename = filename
-        self.check_file_exists()
-
-    def check_file_exists(self):
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'wb') as file:
-                pickle.dump([], file)
-
-    def read_students(self):
-        self.check_file_exists()
-        with open(self.filename, 'rb') as file:
-            return pickle.load(file)
-
-    def update_student(self, student):
-        students = self.read_students()
-        updated_students = [s for s in students if s.id != student.id]
-        updated_students.append(student)
-        with open(self.filename, 'wb') as file:
-            pickle.dump(updated_students, file)
+from tkinter import messagebox, ttk
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from uniapp import Subject, passwords, shared_database
+from uniapp.writebehind import WriteBehindCache
+
+
+class DatabaseWorker:
+    # Owns the Database for the whole GUI. Every call runs in order on one
+    # background thread, and its result comes back on the Tk thread: the
+    # worker only queues finished futures and the event loop drains them
+    # with root.after, since Tk must not be touched from other threads.
+    # The event loop itself never waits on the disk.
+    POLL_MS = 15
+
+    def __init__(self, root, filename='students.data'):
+        self.root = root
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='database')
+        self.finished = queue.SimpleQueue()
+        self.pending = 0
+        self.polling = False
+        self.on_busy = None
+        self.database = None
+        self.submit(self.open, filename)
+
+    def open(self, database, filename):
+        self.database = shared_database(filename)
+
+    def submit(self, function, *args, then=None):
+        # Runs function(database, *args) on the worker, then then(result)
+        # on the Tk thread.
+        self.pending += 1
+        self.show_busy()
+        future = self.executor.submit(lambda: function(self.database, *args))
+        future.add_done_callback(lambda future: self.finished.put((future, then)))
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.POLL_MS, self.poll)
+        return future
+
+    def poll(self):
+        while True:
+            try:
+                future, then = self.finished.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            self.show_busy()
+            if future.exception() is not None:
+                messagebox.showerror("Error", f"Database error: {future.exception()}")
+            elif then is not None:
+                then(future.result())
+        if self.pending:
+            self.root.after(self.POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def show_busy(self):
+        if self.on_busy is not None:
+            self.on_busy(self.pending)
+
+    def close(self):
+        # Runs after everything already queued; the process waits for the
+        # Database to save its aggregates before it exits.
+        self.executor.submit(self.close_database)
+        self.executor.shutdown(wait=True)
+
+    def close_database(self):
+        if self.database is not None:
+            self.database.close()
+
+
+def busy_indicator(frame, buttons):
+    # While the worker has anything pending, the buttons are disabled and
+    # the progress bar runs.
+    progress = ttk.Progressbar(frame, mode='indeterminate', length=200)
+    progress.pack(pady=5)
+
+    def show(pending):
+        for button in buttons:
+            button.config(state=tk.DISABLED if pending else tk.NORMAL)
+        if pending:
+            progress.start(15)
+        else:
+            progress.stop()
+    return show
+
+
+def check_login(database, email, password):
+    student = database.get_by_email(email)
+    if student is not None and passwords.verify_student(database, student, password):
+        return student
+    return None
 
 
 class StudentInfoWindow:
-    def __init__(self, root, student):
+    def __init__(self, root, worker, student):
         self.root = root
+        self.worker = worker
         self.student = student
+        # Changes are batched and written on logout, on a timer, or when
+        # enough pile up; closing the window flushes them too.
+        self.session = WriteBehindCache(worker.database)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         self.setup_ui()
 
     def setup_ui(self):
@@ -75,19 +114,27 @@ class StudentInfoWindow:
         tk.Label(self.main_frame, text=f"Email: {self.student.email}", bg='lightgrey').pack(anchor='w', pady=5)
         tk.Label(self.main_frame, text=f"Student ID: {self.student.id}", bg='lightgrey').pack(anchor='w', pady=5)
 
-        tk.Button(self.main_frame, text="Register New Subject", command=self.register_subject).pack(pady=5)
-        tk.Button(self.main_frame, text="View Subjects", command=self.view_subjects).pack(pady=5)
-        tk.Button(self.main_frame, text="Remove Subject", command=self.remove_subject).pack(pady=5)
-        tk.Button(self.main_frame, text="Logout", command=self.logout).pack(pady=10)
+        buttons = [tk.Button(self.main_frame, text="Register New Subject", command=self.register_subject),
+                   tk.Button(self.main_frame, text="View Subjects", command=self.view_subjects),
+                   tk.Button(self.main_frame, text="Remove Subject", command=self.remove_subject),
+                   tk.Button(self.main_frame, text="Logout", command=self.logout)]
+        for button in buttons[:-1]:
+            button.pack(pady=5)
+        buttons[-1].pack(pady=10)
+        self.worker.on_busy = busy_indicator(self.main_frame, buttons)
 
     def register_subject(self):
         if len(self.student.subjects) >= 4:
             messagebox.showerror("Registration Failed", "You cannot register more than 4 subjects.")
             return
         new_subject = Subject()
-        self.student.subjects.append(new_subject)
-        messagebox.showinfo("Registration Successful", f"Registered new subject: {new_subject}")
-        self.update_student()
+
+        def registered(result):
+            if result is False:
+                messagebox.showerror("Registration Failed", "You cannot register more than 4 subjects.")
+            else:
+                messagebox.showinfo("Registration Successful", f"Registered new subject: {new_subject}")
+        self.update_student(lambda student: student.add_subject(new_subject), then=registered)
 
     def view_subjects(self):
         subjects_info = "\n".join(str(subject) for subject in self.student.subjects)
@@ -99,8 +146,10 @@ class StudentInfoWindow:
             return
 
         subjects_str = "\n".join(f"ID: {subject.id}, {subject}" for subject in self.student.subjects)
-        subject_id = tk.simpledialog.askstring("Remove Subject",
-                                               f"Enter the ID of the subject you want to remove:\n{subjects_str}")
+        # Only needed here, so it is not imported at startup.
+        from tkinter import simpledialog
+        subject_id = simpledialog.askstring("Remove Subject",
+                                            f"Enter the ID of the subject you want to remove:\n{subjects_str}")
 
         if subject_id is None:  
             messagebox.showinfo("Cancelled", "Subject removal cancelled.")
@@ -113,25 +162,29 @@ class StudentInfoWindow:
                 break
 
         if subject_to_remove:
-            self.student.subjects.remove(subject_to_remove)
-            self.update_student()
-            messagebox.showinfo("Success", "Subject removed successfully.")
+            self.update_student(lambda student: student.drop_subject(subject_id), then=lambda result: messagebox.showinfo("Success", "Subject removed successfully."))
         else:
             messagebox.showerror("Error", "No subject found with ID: " + subject_id)
 
     def logout(self):
-        self.main_frame.pack_forget()
-        LoginWindow(self.root)
+        def logged_out(result):
+            self.main_frame.pack_forget()
+            LoginWindow(self.root, self.worker)
+        self.worker.submit(lambda database: self.session.close(), then=logged_out)
 
-    def update_student(self):
-        self.db = Database()
-        self.db.update_student(self.student)
+    def close(self):
+        def closed(result):
+            self.root.destroy()
+        self.worker.submit(lambda database: self.session.close(), then=closed)
+
+    def update_student(self, change, then=None):
+        self.worker.submit(lambda database: self.session.modify_student(self.student, change), then=then)
 
 
 class LoginWindow:
-    def __init__(self, root):
+    def __init__(self, root, worker):
         self.root = root
-        self.db = Database()
+        self.worker = worker
         self.setup_ui()
 
     def setup_ui(self):
@@ -150,26 +203,37 @@ class LoginWindow:
         self.status_label = tk.Label(self.main_frame, text="", bg='lightgrey', fg='red')
         self.status_label.pack(pady=5)
 
-        tk.Button(self.main_frame, text="Login", command=self.login).pack(pady=10)
+        self.login_button = tk.Button(self.main_frame, text="Login", command=self.login)
+        self.login_button.pack(pady=10)
+        self.worker.on_busy = busy_indicator(self.main_frame, [self.login_button])
+        self.worker.show_busy()
 
     def login(self):
         email = self.email_entry.get()
         password = self.password_entry.get()
-        students = self.db.read_students()
-        for student in students:
-            if student.email == email and student.password == password:
-                self.status_label.config(text=f"Welcome {student.name}!", fg='green')
-                self.main_frame.pack_forget()  # 清除登录窗口
-                StudentInfoWindow(self.root, student)  # 跳转到学生信息窗口
-                return
+        # The lookup and the (deliberately slow) password check both run on
+        # the worker.
+        self.status_label.config(text="Checking...", fg='black')
+        self.worker.submit(check_login, email, password, then=self.finish_login)
+
+    def finish_login(self, student):
+        if student is not None:
+            self.status_label.config(text=f"Welcome {student.name}!", fg='green')
+            self.main_frame.pack_forget()  # 清除登录窗口
+            StudentInfoWindow(self.root, self.worker, student)  # 跳转到学生信息窗口
+            return
         self.status_label.config(text="Incorrect email or password.", fg='red')
 
 
 
 def main():
     root = tk.Tk()
-    app = LoginWindow(root)
-    root.mainloop()
+    worker = DatabaseWorker(root)
+    app = LoginWindow(root, worker)
+    try:
+        root.mainloop()
+    finally:
+        worker.close()
 
 if __name__ == "__main__":
     main()
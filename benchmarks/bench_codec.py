@@ -0,0 +1,80 @@
+# Dump time, load time and size of a synthetic roster in the binary record
+# format against pickle protocols 4 and 5, both as one pickled list (the
+# original students.data) and as one pickle per record (the record log
+# before the binary format).
+#
+#   python benchmarks/bench_codec.py [students]
+import gc
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import students
+from uniapp import codec
+
+
+def roster(count):
+    result = list(students(count))
+    for student in result:
+        # Real password hashes are all different; a shared string would be
+        # memoized by pickle and flatter its size.
+        student.password = (student.password + ' ')[:-1]
+    return result
+
+
+def pickled_list(protocol):
+    return (lambda roster: pickle.dumps(roster, protocol=protocol),
+            lambda data: pickle.loads(data),
+            len)
+
+
+def pickled_records(protocol):
+    return (lambda roster: [pickle.dumps(student.__getstate__(), protocol=protocol) for student in roster],
+            codec.loads_many,
+            lambda records: sum(map(len, records)))
+
+
+FORMATS = (
+    ('pickle 4, list', pickled_list(4)),
+    ('pickle 5, list', pickled_list(5)),
+    ('pickle 4, records', pickled_records(4)),
+    ('pickle 5, records', pickled_records(5)),
+    ('binary, records', (codec.dumps_many, codec.loads_many, lambda records: sum(map(len, records)))),
+)
+
+
+def best_of(repeat, function, *args):
+    # The collector is paused while timing, as timeit does: otherwise its
+    # passes over the growing roster swamp the decoding being measured.
+    best = None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = function(*args)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    data = roster(count)
+    print(f"{count} students, best of 3")
+    print(f"{'format':<20} {'dump':>8} {'load':>8} {'size':>10}")
+    for name, (dump, load, size) in FORMATS:
+        dump_time, encoded = best_of(3, dump, data)
+        load_time, decoded = best_of(3, load, encoded)
+        assert [student.__getstate__() for student in decoded] == [student.__getstate__() for student in data]
+        print(f"{name:<20} {dump_time:7.3f}s {load_time:7.3f}s {size(encoded) / 2**20:6.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
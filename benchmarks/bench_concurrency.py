@@ -0,0 +1,82 @@
+# Multi-threaded stress test for Database: many threads update random
+# students at once and every update must survive.
+#
+#   python benchmarks/bench_concurrency.py [threads] [updates per thread] [students]
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from uniapp import Database, Student
+
+
+def seed(database, students):
+    ids = []
+    for number in range(students):
+        student = Student(f"Student {number}", f"student.{number}@university.com", "")
+        student.id = str(number).zfill(6)
+        database.write_student(student)
+        ids.append(student.id)
+    return ids
+
+
+def tick(student):
+    # One update = one more character in the password, so the final length
+    # counts the updates that made it to disk.
+    student.password += 'x'
+
+
+def locked_update(database, student_id):
+    database.modify_student(database.get_by_id(student_id), tick)
+
+
+def unlocked_update(database, student_id):
+    # The pre-locking pattern: read, change, write back.
+    student = database.get_by_id(student_id)
+    tick(student)
+    database.write_student(student)
+
+
+def stress(update, threads, updates, students):
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'students.data'))
+        ids = seed(database, students)
+        expected = {student_id: 0 for student_id in ids}
+        counts_lock = threading.Lock()
+
+        def worker(number):
+            rng = random.Random(number)
+            for _ in range(updates):
+                student_id = rng.choice(ids)
+                update(database, student_id)
+                with counts_lock:
+                    expected[student_id] += 1
+
+        workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        lost = sum(expected[student.id] - len(student.password) for student in database.read_students())
+        database.close()
+        return threads * updates / elapsed, lost
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    students = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    print(f"{threads} threads x {updates} updates over {students} students")
+    for name, update in (('modify_student', locked_update), ('unlocked read/write', unlocked_update)):
+        throughput, lost = stress(update, threads, updates, students)
+        print(f"{name:<20} {throughput:10.0f} updates/s  lost updates: {lost}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# Benchmark suite for the Database and the admin handlers over seeded
+# synthetic rosters. Each scale runs in its own process so its peak RSS
+# is its own; results can be saved as JSON and compared with a saved run.
+# Every synthetic student shares one password hash, so after the first
+# login handle_student_login measures the verification cache; see
+# bench_login.py for the cost of the KDF itself.
+#
+#   python benchmarks/bench_database.py [--scales 1000 100000 1000000]
+#       [--samples 1000] [--seed 42] [--output run.json] [--compare old.json]
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from CLIUniAPP1 import handle_group_students_by_grade, handle_partition_students_by_pass_fail, handle_student_login
+from synthetic import students
+from uniapp import Database, passwords, reports
+
+OPERATIONS = ('import_students', 'write_student', 'email_exists', 'handle_student_login',
+              'read_students', 'grade report', 'pass/fail report', 'delete_student')
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def summary(latencies, count=None):
+    # count is the number of items handled when one call does many of them.
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+
+    return {'calls': len(ordered), 'total_s': round(total, 4),
+            'throughput_per_s': round((count or len(ordered)) / total, 1) if total else None,
+            'p50_ms': round(percentile(50), 4), 'p95_ms': round(percentile(95), 4),
+            'p99_ms': round(percentile(99), 4), 'max_ms': round(ordered[-1] * 1000, 4),
+            'peak_rss_kb': peak_rss_kb()}
+
+
+def timed(calls):
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def scripted_input(answers):
+    answers = iter(answers)
+    return lambda prompt='': next(answers)
+
+
+def run_scale(scale, samples, repeats, seed):
+    rng = random.Random(seed)
+    picked = rng.sample(range(scale), min(samples, scale))
+    width = max(6, len(str(scale - 1)))
+    ids = [str(number).zfill(width) for number in picked]
+    emails = [f"student.{number}@university.com" for number in picked]
+    password_hash = passwords.hasher.hash("Password123")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull:
+        database = Database(os.path.join(directory, 'students.data'))
+        try:
+            results['import_students'] = summary(
+                timed([lambda: database.import_students(students(scale, seed, password_hash))]), scale)
+
+            stored = [database.get_by_id(student_id) for student_id in ids]
+            results['write_student'] = summary(
+                timed([lambda student=student: database.write_student(student) for student in stored]))
+
+            # Half hits, half misses.
+            probes = [email if index % 2 else 'missing.' + email for index, email in enumerate(emails)]
+            results['email_exists'] = summary(
+                timed([lambda email=email: database.email_exists(email) for email in probes]))
+
+            original_input = builtins.input
+            builtins.input = scripted_input(answer for email in emails for answer in (email, 'Password123'))
+            try:
+                with contextlib.redirect_stdout(devnull):
+                    results['handle_student_login'] = summary(
+                        timed([lambda: handle_student_login(database)] * len(emails)))
+            finally:
+                builtins.input = original_input
+
+            results['read_students'] = summary(timed([database.read_students] * repeats), scale * repeats)
+            with contextlib.redirect_stdout(devnull):
+                results['grade report'] = summary(
+                    timed([lambda: handle_group_students_by_grade(database)] * repeats), scale * repeats)
+                results['pass/fail report'] = summary(
+                    timed([lambda: handle_partition_students_by_pass_fail(database)] * repeats), scale * repeats)
+
+            results['delete_student'] = summary(
+                timed([lambda student_id=student_id: database.delete_student(student_id) for student_id in ids]))
+        finally:
+            database.close()
+    return results
+
+
+def print_results(scale, results, baseline=None):
+    print(f"\n{scale} students")
+    print(f"{'operation':<22} {'calls':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'per s':>12} {'RSS MB':>8}")
+    for name in OPERATIONS:
+        row = results[name]
+        line = (f"{name:<22} {row['calls']:>6} {row['p50_ms']:>10.3f} {row['p95_ms']:>10.3f} "
+                f"{row['p99_ms']:>10.3f} {row['throughput_per_s'] or 0:>12.1f} {row['peak_rss_kb'] / 1024:>8.1f}")
+        old = (baseline or {}).get(str(scale), {}).get(name)
+        if old and old['p50_ms']:
+            ratio = row['p50_ms'] / old['p50_ms']
+            line += f"  p50 x{ratio:.2f}" + (" slower" if ratio > 1.1 else "")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database and admin handler benchmarks")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--samples', type=int, default=1000, help="calls per single-student operation")
+    parser.add_argument('--repeats', type=int, default=3, help="calls per whole-roster operation")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="save the results as JSON")
+    parser.add_argument('--compare', help="JSON from an earlier run to compare p50 latencies with")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        json.dump(run_scale(args.child, args.samples, args.repeats, args.seed), sys.stdout)
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+    run = {'python': platform.python_version(), 'numpy': reports.np is not None,
+           'seed': args.seed, 'samples': args.samples, 'repeats': args.repeats,
+           'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': {}}
+    for scale in args.scales:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(scale),
+                                '--samples', str(args.samples), '--repeats', str(args.repeats),
+                                '--seed', str(args.seed)], capture_output=True, text=True, check=True)
+        run['results'][str(scale)] = json.loads(child.stdout)
+        print_results(scale, run['results'][str(scale)], baseline)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(run, file, indent=2)
+        print(f"\nSaved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
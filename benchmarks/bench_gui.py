@@ -0,0 +1,140 @@
+# Event-loop stall time of the GUI over a large roster. A heartbeat
+# callback runs every millisecond while a scripted session (open, login,
+# enrol, drop, logout) drives the windows; any gap beyond that is time the
+# window could not repaint. The same session is then run with the Database
+# calls made directly on the Tk thread, as the GUI used to.
+#
+# Needs a display; on a headless machine run it under Xvfb:
+#   xvfb-run python benchmarks/bench_gui.py [students]
+import os
+import sys
+import tempfile
+import time
+import tkinter as tk
+import tkinter.simpledialog
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import GUIUniAPP
+from synthetic import students
+from uniapp import Database, Subject, close_databases, passwords
+from uniapp.writebehind import WriteBehindCache
+
+FRAME_MS = 1000 / 60
+HEARTBEAT_MS = 1
+
+
+def quiet_dialogs():
+    GUIUniAPP.messagebox.showinfo = GUIUniAPP.messagebox.showerror = lambda *args, **kwargs: None
+
+
+def run_session(root, steps, idle):
+    # Runs each step once the previous one has finished (idle() is true),
+    # recording the gaps between heartbeats meanwhile.
+    gaps = []
+    last = [time.perf_counter()]
+    steps = list(steps)
+
+    def beat():
+        now = time.perf_counter()
+        gaps.append((now - last[0]) * 1000 - HEARTBEAT_MS)
+        last[0] = now
+        root.after(HEARTBEAT_MS, beat)
+
+    def next_step():
+        if not idle():
+            root.after(HEARTBEAT_MS, next_step)
+        elif steps:
+            steps.pop(0)()
+            root.after(HEARTBEAT_MS, next_step)
+        else:
+            root.quit()
+
+    root.after(HEARTBEAT_MS, beat)
+    root.after(HEARTBEAT_MS, next_step)
+    root.mainloop()
+    return gaps
+
+
+def worker_session(root, filename, email):
+    windows = []
+
+    class RecordingWindow(GUIUniAPP.StudentInfoWindow):
+        def __init__(self, *args):
+            super().__init__(*args)
+            windows.append(self)
+
+    GUIUniAPP.StudentInfoWindow = RecordingWindow
+    worker = GUIUniAPP.DatabaseWorker(root, filename)
+    login = GUIUniAPP.LoginWindow(root, worker)
+    login.email_entry.insert(0, email)
+    login.password_entry.insert(0, "Password123")
+    drop = lambda: windows[0].student.subjects[0].id
+    # GUIUniAPP imports simpledialog when a subject is removed.
+    tkinter.simpledialog.askstring = lambda *args, **kwargs: drop()
+    steps = [login.login,
+             lambda: windows[0].register_subject(),
+             lambda: windows[0].register_subject(),
+             lambda: windows[0].remove_subject(),
+             lambda: windows[0].logout()]
+    gaps = run_session(root, steps, lambda: worker.pending == 0)
+    worker.close()
+    return gaps
+
+
+def blocking_session(root, filename, email):
+    state = {}
+
+    def open_database():
+        state['database'] = Database(filename)
+
+    def login():
+        state['student'] = GUIUniAPP.check_login(state['database'], email, "Password123")
+        state['session'] = WriteBehindCache(state['database'])
+
+    def enrol():
+        subject = Subject()
+        state['session'].modify_student(state['student'], lambda student: student.add_subject(subject))
+
+    def drop():
+        subject_id = state['student'].subjects[0].id
+
+        state['session'].modify_student(state['student'], lambda student: student.drop_subject(subject_id))
+
+    steps = [open_database, login, enrol, enrol, drop, lambda: state['session'].close()]
+    gaps = run_session(root, steps, lambda: True)
+    state['database'].close()
+    return gaps
+
+
+def report(name, gaps):
+    ordered = sorted(gaps)
+    over = sum(gap > FRAME_MS for gap in ordered)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{name:<24} max stall {ordered[-1]:8.1f} ms   p99 {p99:6.1f} ms   "
+          f"frames over {FRAME_MS:.1f} ms: {over}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        sys.exit(f"No display ({e}); run under xvfb-run.")
+    root.withdraw()
+    quiet_dialogs()
+    print(f"{count} students")
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'students.data')
+        database = Database(filename)
+        database.import_students(students(count, password_hash=passwords.hasher.hash("Password123")))
+        database.close()
+        email = f"student.{count // 2}@university.com"
+        report('blocking (old)', blocking_session(root, filename, email))
+        report('database worker', worker_session(root, filename, email))
+        close_databases()
+    root.destroy()
+
+
+if __name__ == '__main__':
+    main()
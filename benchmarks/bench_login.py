@@ -0,0 +1,46 @@
+# Login throughput at different password hashing costs: hashing, cold
+# verification on one thread and on the pool, and cached verification.
+#
+#   python benchmarks/bench_login.py [logins per setting]
+import os
+import sys
+import time
+from concurrent.futures import wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from uniapp.passwords import PasswordHasher
+
+SETTINGS = [('scrypt', 2 ** 10), ('scrypt', 2 ** 12), ('scrypt', 2 ** 14), ('scrypt', 2 ** 15),
+            ('pbkdf2_sha256', 100_000), ('pbkdf2_sha256', 600_000)]
+
+
+def rate(count, function):
+    start = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    workers = os.cpu_count() or 4
+    print(f"{logins} logins per setting, pool of {workers}")
+    print(f"{'algorithm':<14} {'cost':>8} {'hash ms':>9} {'verify/s':>10} {'pool/s':>10} {'cached/s':>12}")
+    for algorithm, cost in SETTINGS:
+        # A fresh cache per pass, so only the last column hits it.
+        hasher = PasswordHasher(algorithm, cost, workers=workers)
+        stored = [hasher.hash(f"Password{number:03}") for number in range(logins)]
+        start = time.perf_counter()
+        hasher.hash("Password123")
+        hash_ms = (time.perf_counter() - start) * 1000
+        pairs = [(f"Password{number:03}", stored[number]) for number in range(logins)]
+
+        serial = PasswordHasher(algorithm, cost)
+        single = rate(logins, lambda: [serial.verify(*pair) for pair in pairs])
+        pooled = rate(logins, lambda: wait([hasher.verify_async(*pair) for pair in pairs]))
+        cached = rate(logins * 100, lambda: [hasher.verify(*pair) for pair in pairs * 100])
+        print(f"{algorithm:<14} {cost:>8} {hash_ms:>9.1f} {single:>10.1f} {pooled:>10.1f} {cached:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Memory and pickle size of the __slots__ Student/Subject against the old
+# __dict__-based classes, on a synthetic roster of 1M subjects.
+#
+#   python benchmarks/bench_models.py [subjects]
+import os
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from uniapp import Student, Subject
+
+
+class LegacySubject:
+    def __init__(self, number, score):
+        self.id = str(number).zfill(3)
+        self.score = score
+        self.grade = 'Z' if score < 50 else 'P' if score < 65 else 'C' if score < 75 else 'D' if score < 85 else 'HD'
+
+
+class LegacyStudent:
+    def __init__(self, number):
+        self.id = str(number).zfill(6)
+        self.name = f"Student {number}"
+        self.email = f"student.{number}@university.com"
+        self.password = "Password123"
+        self.subjects = []
+
+
+def build_legacy(subjects):
+    rng = random.Random(42)
+    roster = []
+    for number in range(subjects // 4):
+        student = LegacyStudent(number)
+        student.subjects = [LegacySubject(rng.randint(1, 999), rng.randint(25, 100)) for _ in range(4)]
+        roster.append(student)
+    return roster
+
+
+def build_compact(subjects):
+    rng = random.Random(42)
+    roster = []
+    for number in range(subjects // 4):
+        student = Student.__new__(Student)
+        student.id = str(number).zfill(6)
+        student.name = f"Student {number}"
+        student.email = f"student.{number}@university.com"
+        student.password = "Password123"
+        student.subjects = [Subject.restore(rng.randint(1, 999), rng.randint(25, 100)) for _ in range(4)]
+        roster.append(student)
+    return roster
+
+
+def measure(name, build, subjects):
+    tracemalloc.start()
+    start = time.perf_counter()
+    roster = build(subjects)
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # students.data stores one pickle per student.
+    size = sum(len(pickle.dumps(student, protocol=pickle.HIGHEST_PROTOCOL)) for student in roster)
+    print(f"{name:<8} build {elapsed:6.2f}s  memory {memory / 2**20:8.1f} MiB  pickled {size / 2**20:8.1f} MiB")
+    return memory, size
+
+
+def main():
+    subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{subjects} subjects, {subjects // 4} students")
+    legacy_memory, legacy_size = measure('legacy', build_legacy, subjects)
+    compact_memory, compact_size = measure('compact', build_compact, subjects)
+    print(f"memory x{legacy_memory / compact_memory:.2f} smaller, pickle x{legacy_size / compact_size:.2f} smaller")
+
+
+if __name__ == '__main__':
+    main()
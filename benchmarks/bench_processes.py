@@ -0,0 +1,84 @@
+# Several processes update the same students.data at once, the way a few
+# terminals and the GUI do during enrolment week. Reports throughput for
+# each process count and checks that no update was lost.
+#
+#   python benchmarks/bench_processes.py [max processes] [updates per process] [students]
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from uniapp import Database, Student
+
+
+def tick(student):
+    # One update = one more character in the password.
+    student.password += 'x'
+
+
+def worker(filename, number, updates, students, threads, done):
+    database = Database(filename)
+    ids = [str(index).zfill(6) for index in range(students)]
+    counts = {}
+
+    def run(seed):
+        rng = random.Random(seed)
+        for _ in range(updates // threads):
+            student_id = rng.choice(ids)
+            database.modify_student(database.get_by_id(student_id), tick)
+            counts[student_id] = counts.get(student_id, 0) + 1
+
+    workers = [threading.Thread(target=run, args=(number * threads + index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    database.close()
+    done.put(counts)
+
+
+def stress(processes, updates, students, threads):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'students.data')
+        database = Database(filename)
+        for index in range(students):
+            student = Student(f"Student {index}", f"student.{index}@university.com", "")
+            student.id = str(index).zfill(6)
+            database.write_student(student)
+        done = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker, args=(filename, number, updates, students, threads, done))
+                   for number in range(processes)]
+        start = time.perf_counter()
+        for process in workers:
+            process.start()
+        expected = {}
+        for _ in workers:
+            for student_id, count in done.get().items():
+                expected[student_id] = expected.get(student_id, 0) + count
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - start
+        lost = sum(expected.get(student.id, 0) - len(student.password) for student in Database(filename).read_students())
+        database.close()
+        return sum(expected.values()) / elapsed, lost
+
+
+def main():
+    max_processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    students = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    processes = 1
+    while processes <= max_processes:
+        for threads in (1, 4):
+            throughput, lost = stress(processes, updates, students, threads)
+            print(f"{processes:2} processes x {threads} threads  {throughput:8.0f} updates/s  lost updates: {lost}")
+        processes *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Time the grade and pass/fail admin reports over a synthetic roster: the
+# columnar recomputation, and the handlers answering from the Database's
+# incrementally kept aggregates.
+#
+#   python benchmarks/bench_reports.py [enrolments]
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from CLIUniAPP1 import grade_lines, handle_group_students_by_grade, handle_partition_students_by_pass_fail
+from uniapp import Database, Student, Subject, reports
+from uniapp.reports import Aggregates, Roster
+
+
+def build(enrolments):
+    rng = random.Random(42)
+    students = []
+    for number in range(enrolments // 4):
+        student = Student.__new__(Student)
+        student.id = str(number).zfill(6)
+        student.name = f"Student {number}"
+        student.email = f"student.{number}@university.com"
+        student.password = "Password123"
+        student.subjects = [Subject.restore(rng.randint(1, 999), rng.randint(25, 100)) for _ in range(4)]
+        students.append(student)
+    return students
+
+
+def timed(name, function):
+    start = time.perf_counter()
+    result = function()
+    print(f"{name:<28} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main():
+    enrolments = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{enrolments} enrolments, NumPy {'on' if reports.np is not None else 'off'}")
+    students = build(enrolments)
+    roster = timed('columns', lambda: Roster(students))
+    timed('grade buckets', lambda: [list(roster.by_student(roster.grade_rows(code))) for code in range(len(reports.GRADES))])
+    timed('averages + pass/fail', roster.pass_rows)
+    timed('aggregates from scratch', lambda: Aggregates.rebuild((student.id, student) for student in students))
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'students.data'))
+        timed('import (keeps aggregates)', lambda: database.import_students(students))
+        timed('first grade report row', lambda: next(grade_lines(database, 0)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            grade_report = timed_quiet(handle_group_students_by_grade, database)
+            pass_fail_report = timed_quiet(handle_partition_students_by_pass_fail, database)
+            page_report = timed_quiet(lambda database: handle_group_students_by_grade(database, limit=20, offset=1000), database)
+        print(f"{'full grade report':<28} {grade_report:8.3f}s")
+        print(f"{'full pass/fail report':<28} {pass_fail_report:8.3f}s")
+        print(f"{'grade report, 20 per grade':<28} {page_report:8.3f}s")
+        timed('consistency check', database.check_aggregates)
+        database.close()
+
+
+def timed_quiet(handler, database):
+    start = time.perf_counter()
+    handler(database)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+# Load test for the JSON API: starts `CLIUniAPP1.py serve` on a seeded
+# roster in a temporary directory and measures requests per second and
+# latency from concurrent clients on localhost, with kept-alive and fresh
+# connections and with batch bodies.
+#
+#   python benchmarks/bench_server.py [--students N] [--clients N] [--seconds S]
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from synthetic import students
+from uniapp import Database
+from uniapp.client import Client
+
+BATCH_SIZE = 50
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(directory, port):
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'CLIUniAPP1.py'), 'serve', '--port', str(port)],
+                              cwd=directory, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line.startswith('Serving'):
+        server.kill()
+        raise RuntimeError(f"server did not start: {line!r}")
+    return server
+
+
+def email(number):
+    return f"student.{number}@university.com"
+
+
+def login(client, number):
+    return client.post('/login', {'email': email(number), 'password': 'Password123'})[1]['token']
+
+
+# Each scenario makes one request (or batch) per call and returns how many
+# API calls it carried.
+def list_students(client, rng, state):
+    client.get(f"/students?offset={rng.randrange(1000)}&limit=20")
+    return 1
+
+
+def cached_login(client, rng, state):
+    login(client, state['number'])
+    return 1
+
+
+def enrol_and_drop(client, rng, state):
+    status, body = client.post('/enrol', {'token': state['token']})
+    if status == 201:
+        client.post('/drop', {'token': state['token'], 'subject_id': body['subject']['id']})
+        return 2
+    return 1
+
+
+def pass_fail_report(client, rng, state):
+    client.get(f"/reports/pass-fail?offset={rng.randrange(1000)}&limit=20")
+    return 1
+
+
+def batch_login(client, rng, state):
+    client.post('/login', [{'email': email(state['number']), 'password': 'Password123'}] * BATCH_SIZE)
+    return BATCH_SIZE
+
+
+SCENARIOS = [
+    ('list 20, keep-alive', list_students, True),
+    ('list 20, new connection', list_students, False),
+    ('login, cached', cached_login, True),
+    ('enrol + drop', enrol_and_drop, True),
+    ('pass/fail report, 20', pass_fail_report, True),
+    (f'login, batches of {BATCH_SIZE}', batch_login, True),
+]
+
+
+def run(port, scenario, keep_alive, clients, seconds, population):
+    latencies = []
+    calls = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(seed):
+        nonlocal calls
+        rng = random.Random(seed)
+        client = Client(port=port, keep_alive=keep_alive)
+        state = {'number': rng.randrange(population)}
+        state['token'] = login(client, state['number'])
+        mine, count = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            count += scenario(client, rng, state)
+            mine.append(time.perf_counter() - start)
+        client.close()
+        with lock:
+            latencies.extend(mine)
+            calls += count
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (len(latencies) / elapsed, calls / elapsed,
+            latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON API load test")
+    parser.add_argument('--students', type=int, default=10_000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'students.data'))
+        database.import_students(students(args.students))
+        database.close()
+        port = free_port()
+        server = start_server(directory, port)
+        try:
+            print(f"{args.students} students, {args.clients} clients, {args.seconds:g}s per scenario")
+            print(f"{'scenario':<26} {'requests/s':>11} {'calls/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+            for name, scenario, keep_alive in SCENARIOS:
+                requests, calls, p50, p99 = run(port, scenario, keep_alive, args.clients, args.seconds, args.students)
+                print(f"{name:<26} {requests:>11.0f} {calls:>9.0f} {p50:>8.2f} {p99:>8.2f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Speedup curve of rebuilding the report aggregates from a data file with
+# the roster split into shards, one process each, against the one-record-
+# at-a-time rebuild in a single process.
+#
+#   python benchmarks/bench_shards.py [students] [max workers]
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import students
+from uniapp import Database, shards
+from uniapp.reports import Aggregates
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 250_000
+    most = int(sys.argv[2]) if len(sys.argv) > 2 else max(8, os.cpu_count() or 1)
+    # Shard however small the roster, so every worker count is measured.
+    shards.MIN_SHARD = 1
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'students.data'))
+        database.import_students(students(count))
+        # Reopen once any checkpoint the import set off has replaced the file.
+        database.close()
+        database = Database(database.filename)
+        log = database.log
+        keys, offsets = list(log.offsets), list(log.offsets.values())
+
+        def serial():
+            fresh = Aggregates()
+            for key, offset in log.offsets.items():
+                fresh.add(key, log.read(offset))
+            return fresh
+
+        baseline, expected = timed(serial)
+        print(f"{count} students, {os.cpu_count()} cores")
+        print(f"{'workers':>7} {'seconds':>9} {'speedup':>8}")
+        print(f"{'serial':>7} {baseline:>9.2f} {1:>8.2f}")
+        workers = 2
+        while workers <= most:
+            elapsed, fresh = timed(lambda: shards.build_aggregates(database.filename, log.stat.st_ino, keys, offsets, workers))
+            assert not fresh.differences(expected)
+            print(f"{workers:>7} {elapsed:>9.2f} {baseline / elapsed:>8.2f}")
+            workers *= 2
+        database.close()
+
+
+if __name__ == '__main__':
+    main()
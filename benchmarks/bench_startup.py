@@ -0,0 +1,77 @@
+# Cold start of the entry points: import time from `python -X importtime`
+# and wall-clock time until the first byte of output, for one-shot CLI
+# commands against a seeded roster in a temporary directory.
+#
+#   python benchmarks/bench_startup.py [--students N] [--runs N]
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from synthetic import students
+from uniapp import Database
+
+CLI = os.path.join(ROOT, 'CLIUniAPP1.py')
+COMMANDS = [
+    ('python, nothing imported', ['-c', 'pass']),
+    ('import uniapp', ['-c', 'import uniapp']),
+    ('import GUIUniAPP', ['-c', 'import GUIUniAPP']),
+    ('cli --help', [CLI, '--help']),
+    ('cli snapshots', [CLI, 'snapshots']),
+    ('cli query, top 5', [CLI, '--limit', '5', 'query', '--order=-average']),
+    ('cli grades, 5 each', [CLI, '--limit', '5', 'grades']),
+]
+# Top-level modules only: "import time: self | cumulative | name".
+TOP_LEVEL = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \| (\S+)$')
+
+
+def import_ms(arguments, directory):
+    result = subprocess.run([sys.executable, '-X', 'importtime', *arguments], cwd=directory,
+                            env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True)
+    total = 0
+    for line in result.stderr.splitlines():
+        match = TOP_LEVEL.match(line)
+        if match:
+            total += int(match.group(1))
+    return total / 1000
+
+
+def first_output_ms(arguments, directory):
+    # Some commands print nothing ('pass', an import); then it is the time
+    # to exit.
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, *arguments], cwd=directory, env=dict(os.environ, PYTHONPATH=ROOT),
+                               stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    process.stdout.read(1)
+    elapsed = time.perf_counter() - start
+    process.stdout.read()
+    process.wait()
+    return elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI and GUI startup time")
+    parser.add_argument('--students', type=int, default=10_000)
+    parser.add_argument('--runs', type=int, default=9)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'students.data'))
+        database.import_students(students(args.students))
+        database.close()
+        print(f"{args.students} students, median of {args.runs} runs")
+        print(f"{'command':<26} {'imports ms':>10} {'first output ms':>16}")
+        for name, arguments in COMMANDS:
+            imports = statistics.median(import_ms(arguments, directory) for _ in range(args.runs))
+            first = statistics.median(first_output_ms(arguments, directory) for _ in range(args.runs))
+            print(f"{name:<26} {imports:>10.1f} {first:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Seeded synthetic rosters: the same seed and size always give the same
+# students, so benchmark runs can be compared.
+#
+#   python benchmarks/synthetic.py students path.csv|path.jsonl [seed]
+import csv
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from uniapp import Student, Subject, passwords
+
+
+def students(count, seed=42, password_hash=None):
+    # Everyone's password is "Password123", hashed once and shared: hashing
+    # a million passwords would take longer than the benchmarks themselves.
+    password_hash = password_hash or passwords.hasher.hash("Password123")
+    rng = random.Random(seed)
+    width = max(6, len(str(count - 1)))
+    for number in range(count):
+        student = Student.__new__(Student)
+        student.id = str(number).zfill(width)
+        student.name = f"Student {number}"
+        student.email = f"student.{number}@university.com"
+        student.password = password_hash
+        # Distinct subject ids, as the importer requires.
+        student.subjects = [Subject.restore(number, rng.randint(25, 100))
+                            for number in rng.sample(range(1, 1000), rng.randint(0, 4))]
+        yield student
+
+
+def write_roster(path, count, seed=42):
+    # Writes the roster in the format the CLI's import command reads.
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        if path.endswith(('.jsonl', '.json')):
+            for student in students(count, seed):
+                subjects = [{'id': subject.id, 'score': subject.score} for subject in student.subjects]
+                file.write(json.dumps({'id': student.id, 'name': student.name, 'email': student.email,
+                                       'password': student.password, 'subjects': subjects}) + '\n')
+        else:
+            writer = csv.writer(file)
+            writer.writerow(('id', 'name', 'email', 'password', 'subjects'))
+            for student in students(count, seed):
+                subjects = ';'.join(f"{subject.id}:{subject.score}" for subject in student.subjects)
+                writer.writerow((student.id, student.name, student.email, student.password, subjects))
+
+
+if __name__ == '__main__':
+    write_roster(sys.argv[2], int(sys.argv[1]), int(sys.argv[3]) if len(sys.argv) > 3 else 42)
@@ -0,0 +1,4 @@
+# Models, storage and validation shared by the CLI and the GUI.
+from .database import Database, close_databases, shared_database
+from .models import GRADES, Student, Subject
+from .validation import valid_email, valid_password
@@ -0,0 +1,28 @@
+import http.client
+import json
+
+
+class Client:
+    # JSON calls to a uniapp.server over one kept-alive connection, which
+    # http.client reopens by itself if the server closed it.
+    def __init__(self, host='127.0.0.1', port=8765, keep_alive=True, timeout=30):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.headers = {'Content-Type': 'application/json'}
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+
+    def request(self, method, path, body=None):
+        # Returns (status, decoded JSON body).
+        data = None if body is None else json.dumps(body).encode()
+        self.connection.request(method, path, data, self.headers)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post(self, path, body):
+        return self.request('POST', path, body)
+
+    def close(self):
+        self.connection.close()
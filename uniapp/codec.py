@@ -0,0 +1,107 @@
+import io
+import struct
+
+from .models import Student, Subject
+
+# A record's payload is one student in a fixed binary layout:
+#   <u8 format><u8 subject count><u16 id len><u16 name len><u16 email len>
+#   <u16 password len>, then id, name, email and password as UTF-8, then
+#   <u16 subject id>* and <u8 score>*, one of each per subject.
+# Nothing is looked up by name while reading, so the file neither depends on
+# where Student is defined nor can make us run anything. The first byte
+# tells this apart from the pickles older files hold (those start at 0x80,
+# or with a printable opcode for protocol 0/1), and lets the layout change
+# later without rewriting the file.
+FORMAT = 1
+STUDENT = struct.Struct('<BBHHHH')
+# Grade code for every score a byte can hold, so decoding does not go
+# through Subject.determine_grade for each subject.
+GRADE_CODES = bytes(Subject.restore(0, score).grade_code for score in range(256))
+
+
+def dumps(student):
+    strings = [student.id.encode(), student.name.encode(), student.email.encode(), student.password.encode()]
+    subjects = student.subjects
+    count = len(subjects)
+    return b''.join((
+        STUDENT.pack(FORMAT, count, *map(len, strings)),
+        *strings,
+        struct.pack(f'<{count}H', *[subject.number for subject in subjects]),
+        bytes([subject.score for subject in subjects]),
+    ))
+
+
+def dumps_many(students):
+    return [dumps(student) for student in students]
+
+
+def loads(data):
+    if not data or data[0] != FORMAT:
+        return load_pickle(data)
+    version, count, id_length, name_length, email_length, password_length = STUDENT.unpack_from(data)
+    student = Student.__new__(Student)
+    position = STUDENT.size
+    end = position + id_length
+    student.id = data[position:end].decode()
+    position, end = end, end + name_length
+    student.name = data[position:end].decode()
+    position, end = end, end + email_length
+    student.email = data[position:end].decode()
+    position, end = end, end + password_length
+    student.password = data[position:end].decode()
+    numbers = struct.unpack_from(f'<{count}H', data, end)
+    subjects = []
+    for number, score in zip(numbers, data[end + 2 * count:end + 3 * count]):
+        subject = Subject.__new__(Subject)
+        subject.number = number
+        subject.score = score
+        subject.grade_code = GRADE_CODES[score]
+        subjects.append(subject)
+    student.subjects = subjects
+    return student
+
+
+def loads_many(payloads):
+    return [loads(data) for data in payloads]
+
+
+# Records written before the binary format hold a pickle: of Student's state
+# tuple (see Student.__getstate__), or, in older files still, of the object
+# itself under whichever script wrote it (__main__.Student from the CLI or
+# the GUI). Those are mapped onto the classes here.
+CLASSES = {'Student': Student, 'Subject': Subject}
+MODULES = ('uniapp.models', '__main__', 'CLIUniAPP1', 'GUIUniAPP')
+# What protocol 0/1 pickles of plain objects need besides the class.
+SAFE_GLOBALS = {('copyreg', '_reconstructor'), ('builtins', 'object')}
+
+
+unpickler = None
+
+
+def record_unpickler():
+    # Defined on first use, so pickle is only imported for files that still
+    # hold pickled records. Nothing but our own classes can be loaded, so a
+    # tampered file cannot name some other callable to run.
+    global unpickler
+    if unpickler is None:
+        import pickle
+
+        class RecordUnpickler(pickle.Unpickler):
+            def find_class(self, module, name):
+                if module in MODULES and name in CLASSES:
+                    return CLASSES[name]
+                if (module, name) in SAFE_GLOBALS:
+                    return super().find_class(module, name)
+                raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a data file")
+
+        unpickler = RecordUnpickler
+    return unpickler
+
+
+def load_pickle(data):
+    value = record_unpickler()(io.BytesIO(data)).load()
+    if isinstance(value, tuple):
+        student = Student.__new__(Student)
+        student.__setstate__(value)
+        return student
+    return value
@@ -0,0 +1,288 @@
+import threading
+from itertools import islice
+
+from . import codec, metrics
+from .idalloc import IdAllocator
+from .locking import SCAN_BYTE, STRIPES_BYTE, FileLock, RWLock, StripedLock
+from .models import Student
+from .query import select_ids
+from .recordlog import RecordLog
+from .reports import Aggregates, page
+from .snapshots import Snapshots
+
+
+def build_aggregates(filename, ino, keys, offsets):
+    # Imported on first use: shards brings in multiprocessing, which takes
+    # longer to import than the rest of the package, and only a rebuild of
+    # a large roster needs it.
+    from . import shards
+    return shards.build_aggregates(filename, ino, keys, offsets)
+
+
+IMPORT_BATCH_SIZE = 10_000
+
+
+class Database:
+    def __init__(self, filename='students.data'):
+        self.filename = filename
+        # The data file is opened on first use of `log`, so a command that
+        # never reads it does not pay for loading its index.
+        self.record_log = None
+        self.open_lock = threading.Lock()
+        self.file_lock = FileLock(self.filename + '.lock')
+        self.snapshots = Snapshots(self.filename + '.snapshots')
+        # Per-student work takes the scan lock shared plus its id (or email)
+        # stripe; only clearing the whole roster takes it exclusively. All of
+        # them hold across processes through the data file's lock file.
+        self.scan_lock = RWLock(self.file_lock, SCAN_BYTE)
+        self.id_locks = StripedLock(64, self.file_lock, STRIPES_BYTE, 'id')
+        self.email_locks = StripedLock(64, self.file_lock, STRIPES_BYTE + 64, 'email')
+        self.ids = IdAllocator(self.filename + '.ids', self.file_lock, first=self.first_free_id)
+
+    @property
+    def log(self):
+        if self.record_log is None:
+            with self.open_lock:
+                if self.record_log is None:
+                    self.check_file_exists()
+        return self.record_log
+
+    def initialize_file(self):
+        with self.scan_lock.exclusive():
+            self.check_file_exists()
+
+    def check_file_exists(self):
+        # The report aggregates follow every record the log applies, ours
+        # or another process's, from the first report that needs them on.
+        self.aggregates = Aggregates()
+        self.record_log = RecordLog(self.filename, aggregates=self.aggregates, codec=codec, snapshots=self.snapshots,
+                                    rebuild=build_aggregates, file_lock=self.file_lock)
+
+    def close(self):
+        if self.record_log is not None:
+            self.record_log.close()
+        else:
+            self.file_lock.close()
+
+    def first_free_id(self):
+        # Only needed once per data file, to start the id counter past any
+        # ids already stored (older versions picked them at random).
+        return max((int(key) for key in self.log.keys() if key.isdigit()), default=0) + 1
+
+    def new_student_id(self):
+        return str(self.ids.allocate()).zfill(6)
+
+    @metrics.timed('database.get_by_id')
+    def get_by_id(self, student_id):
+        return self.log.get(student_id)
+
+    @metrics.timed('database.get_by_email')
+    def get_by_email(self, email):
+        return self.log.find(email)
+
+    @metrics.timed('database.get_many')
+    def get_many(self, student_ids):
+        return self.log.get_many(student_ids)
+
+    def id_exists(self, student_id):
+        return self.log.contains(student_id)
+
+    @metrics.timed('database.email_exists')
+    def email_exists(self, email):
+        try:
+            return self.log.contains_index(email)
+        except Exception as e:
+            print(f"Error reading from file: {e}")
+            return False
+
+    @metrics.timed('database.register_student')
+    def register_student(self, student):
+        # Check-and-insert under the email's lock so two registrations with
+        # the same email cannot both succeed.
+        student.id = self.new_student_id()
+        with self.scan_lock.shared(), self.email_locks(student.email), self.id_locks(student.id):
+            try:
+                if self.log.contains_index(student.email):
+                    return False
+                self.log.put(student.id, student)
+                return True
+            except Exception as e:
+                print(f"Error writing to file: {e}")
+                return False
+
+    @metrics.timed('database.write_student')
+    def write_student(self, student):
+        with self.scan_lock.shared(), self.id_locks(student.id):
+            try:
+                self.log.put(student.id, student)
+            except Exception as e:
+                print(f"Error writing to file: {e}")
+
+    @metrics.timed('database.modify_student')
+    def modify_student(self, student, change):
+        # Applies change to the latest stored copy of the student under its
+        # lock, so concurrent sessions do not overwrite each other, then
+        # brings the caller's copy up to date. A False result skips the write.
+        with self.scan_lock.shared(), self.id_locks(student.id):
+            try:
+                current = self.log.get(student.id)
+                if current is None:
+                    current = student
+                result = change(current)
+                if result is not False:
+                    self.log.put(current.id, current)
+            except Exception as e:
+                print(f"Error writing to file: {e}")
+                return False
+        for name in Student.__slots__:
+            setattr(student, name, getattr(current, name))
+        return result
+
+    @metrics.timed('database.read_students')
+    def read_students(self):
+        with self.scan_lock.shared():
+            try:
+                return self.log.values()
+            except Exception as e:
+                print(f"Error reading from file: {e}")
+                return []  
+
+    def iter_students(self):
+        return self.log.iter_values()
+
+    @metrics.timed('database.student_ids')
+    def student_ids(self, offset=0, limit=None):
+        # A page of ids in roster order, without loading any student.
+        with self.log.lock:
+            self.log.refresh()
+            return list(page(self.log.offsets, offset, limit))
+
+    @metrics.timed('database.report_ids')
+    def report_ids(self, select, offset=0, limit=None):
+        # Student ids picked out of the aggregates, in roster order.
+        return self.log.read_aggregates(lambda aggregates: list(page(select(aggregates), offset, limit)))
+
+    @metrics.timed('database.query')
+    def query(self, offset=0, limit=None, **filters):
+        # Students matching the filters (see uniapp.query). Only they are
+        # read; who matches comes from the aggregates.
+        return self.log.read_aggregates(
+            lambda aggregates: self.log.get_many(select_ids(aggregates, offset=offset, limit=limit, **filters)))
+
+    @metrics.timed('database.check_aggregates')
+    def check_aggregates(self, repair=False):
+        # Rebuilds the aggregates from the students themselves and lists
+        # where the kept ones differ; writers are held off meanwhile.
+        def check(aggregates):
+            fresh = build_aggregates(self.filename, self.log.stat.st_ino, list(self.log.offsets), list(self.log.offsets.values()))
+            if fresh is None:
+                fresh = Aggregates.rebuild((key, self.log.read(offset)) for key, offset in self.log.offsets.items())
+            found = aggregates.differences(fresh)
+            if found and repair:
+                self.log.replace_aggregates(fresh)
+            return found
+        with self.scan_lock.exclusive():
+            return self.log.read_aggregates(check)
+
+    @metrics.timed('database.convert_file')
+    def convert_file(self):
+        # Rewrites every stored student in the current record format; the
+        # roster is held still meanwhile. Returns how many were rewritten.
+        with self.scan_lock.exclusive():
+            try:
+                return self.log.recode()
+            except Exception as e:
+                print(f"Error converting file: {e}")
+                return 0
+
+    @metrics.timed('database.import_students')
+    def import_students(self, students):
+        # Streams the students into the file a batch at a time, one fsync
+        # per batch, then moves the id counter past the highest id the file
+        # brought along. Each batch is drawn from `students` before the
+        # write lock is taken, so slow work in the stream (hashing imported
+        # passwords) does not hold off other writers. An email registered
+        # meanwhile by another student wins over the imported row. Errors
+        # reading the stream are left to the caller.
+        highest = 0
+        count = 0
+        students = iter(students)
+        try:
+            while True:
+                batch = list(islice(students, IMPORT_BATCH_SIZE))
+                if not batch:
+                    return count
+                for student in batch:
+                    if student.id.isdigit():
+                        highest = max(highest, int(student.id))
+                try:
+                    with self.scan_lock.shared(), self.log.write_lock:
+                        self.log.refresh()
+                        count += self.log.put_many((student.id, student) for student in batch
+                                                   if self.log.index.get(self.log.index_key(student), student.id) == student.id)
+                except Exception as e:
+                    print(f"Error writing to file: {e}")
+                    return count
+        finally:
+            self.ids.advance(highest)
+
+    @metrics.timed('database.delete_student')
+    def delete_student(self, student_id):
+        with self.scan_lock.shared(), self.id_locks(student_id):
+            try:
+                return self.log.delete(student_id)
+            except Exception as e:
+                print(f"Error deleting student: {e}")
+                return False
+
+    def clear_students(self, ask=True):
+     confirm = input("Are you sure you want to clear all student data? Type 'yes' to confirm: ") if ask else 'yes'
+     if confirm.lower() == 'yes':
+        with self.scan_lock.exclusive():
+            try:
+                snapshot = self.log.clear()
+                print("All student data has been successfully cleared.")
+                if snapshot:
+                    print(f"The roster was kept as snapshot {snapshot}; restore it to undo this.")
+            except Exception as e:
+                print(f"Error clearing student data: {e}")
+     else:
+        print("Operation cancelled.")
+
+
+    def snapshot_names(self):
+        # Oldest first.
+        return self.snapshots.names()
+
+    @metrics.timed('database.restore_snapshot')
+    def restore_snapshot(self, name):
+        # Puts the roster back as it was when the snapshot was taken.
+        if name not in self.snapshot_names():
+            return False
+        with self.scan_lock.exclusive():
+            try:
+                self.log.restore(self.snapshots.path(name))
+                return True
+            except Exception as e:
+                print(f"Error restoring snapshot: {e}")
+                return False
+
+
+databases = {}
+databases_lock = threading.Lock()
+
+def shared_database(filename='students.data'):
+    # One Database per data file for the whole process.
+    with databases_lock:
+        if filename not in databases:
+            databases[filename] = Database(filename)
+        return databases[filename]
+
+
+def close_databases():
+    # At exit: closing a Database saves its aggregates, so the next start
+    # does not decode the records written since they were last saved.
+    with databases_lock:
+        for database in databases.values():
+            database.close()
+        databases.clear()
@@ -0,0 +1,63 @@
+import os
+import struct
+import threading
+
+from .locking import IDS_BYTE, ProcessLock
+from .recordlog import sync_directory
+
+COUNTER = struct.Struct('<Q')
+
+
+class IdAllocator:
+    # Hands out increasing integers from a counter kept in <data file>.ids.
+    # Each process reserves a block of `block` ids under the file lock and
+    # then allocates from it in memory, so an allocation is O(1) and touches
+    # the disk once per block. Ids reserved but not used when a process
+    # exits are skipped, never reused.
+    def __init__(self, filename, file_lock=None, block=64, first=None):
+        self.filename = filename
+        self.block = block
+        # Called once, when the counter file does not exist yet, for the
+        # first id to hand out (the data file may already hold students).
+        self.first = first or (lambda: 1)
+        self.lock = threading.Lock()
+        self.process_lock = ProcessLock(file_lock, IDS_BYTE, 'ids')
+        self.next = 0
+        self.limit = 0
+
+    def allocate(self):
+        with self.lock:
+            if self.next >= self.limit:
+                self.next = self.reserve(lambda counter: counter)
+                self.limit = self.next + self.block
+            value = self.next
+            self.next += 1
+            return value
+
+    def advance(self, past):
+        # Make sure no id up to `past` is handed out from now on, e.g. after
+        # importing students that brought their own ids.
+        with self.lock:
+            self.reserve(lambda counter: max(counter, past + 1), claim=0)
+            if self.next <= past:
+                self.next = self.limit = 0
+
+    def reserve(self, start, claim=None):
+        # Moves the stored counter past `start(counter) + claim` and returns
+        # start(counter).
+        with self.process_lock:
+            try:
+                with open(self.filename, 'rb') as file:
+                    counter = COUNTER.unpack(file.read(COUNTER.size))[0]
+            except (FileNotFoundError, struct.error):
+                counter = self.first()
+            value = start(counter)
+            stored = value + (self.block if claim is None else claim)
+            if stored != counter:
+                with open(self.filename + '.tmp', 'wb') as file:
+                    file.write(COUNTER.pack(stored))
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(self.filename + '.tmp', self.filename)
+                sync_directory(self.filename)
+            return value
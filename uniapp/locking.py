@@ -0,0 +1,157 @@
+import errno
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Byte offsets in the <data file>.lock side file. Every lock below is a
+# thread lock paired with an fcntl lock on one byte, so the CLI, the GUI and
+# any number of terminals exclude each other the same way threads do.
+WRITE_BYTE = 0
+SCAN_BYTE = 1
+STRIPES_BYTE = 2
+# After the Database's two pools of 64 stripes (ids, then emails).
+IDS_BYTE = STRIPES_BYTE + 128
+
+
+class FileLock:
+    # fcntl record locks are per process, so callers must already exclude
+    # other threads of their own process (the thread locks below do).
+    # Without fcntl (Windows) this only does the thread-level locking.
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644) if fcntl is not None else None
+
+    def acquire(self, byte, exclusive=True):
+        if self.fd is None:
+            return
+        while True:
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, 1, byte)
+                return
+            except OSError as e:
+                # The kernel's deadlock check treats a process as one owner,
+                # so two processes whose *different* threads wait on each
+                # other look deadlocked. Locks here are always taken in the
+                # same order (scan, stripe, write), so just wait and retry.
+                if e.errno != errno.EDEADLK:
+                    raise
+                time.sleep(0.001)
+
+    def release(self, byte):
+        if self.fd is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, byte)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class ProcessLock:
+    # Reentrant on the owning thread; the file byte is taken on the first
+    # acquire and dropped on the last release. `name` labels the time spent
+    # waiting for it in the metrics.
+    def __init__(self, file_lock=None, byte=0, name='lock'):
+        self.lock = threading.RLock()
+        self.file_lock = file_lock
+        self.byte = byte
+        self.depth = 0
+        self.wait_metric = f'wait.{name}'
+
+    def __enter__(self):
+        start = time.perf_counter() if metrics.enabled else None
+        self.lock.acquire()
+        if self.depth == 0 and self.file_lock is not None:
+            try:
+                self.file_lock.acquire(self.byte)
+            except BaseException:
+                self.lock.release()
+                raise
+        self.depth += 1
+        if start is not None:
+            metrics.observe(self.wait_metric, time.perf_counter() - start)
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0 and self.file_lock is not None:
+            self.file_lock.release(self.byte)
+        self.lock.release()
+
+
+class RWLock:
+    # Any number of readers or one writer. A waiting writer holds off new
+    # readers so a clear is not starved by a steady stream of updates.
+    # Not reentrant: do not take it twice on the same thread.
+    def __init__(self, file_lock=None, byte=SCAN_BYTE, name='scan'):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.file_lock = file_lock
+        self.byte = byte
+        self.wait_metric = f'wait.{name}'
+
+    @contextmanager
+    def shared(self):
+        start = time.perf_counter() if metrics.enabled else None
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            if self.readers == 0 and self.file_lock is not None:
+                self.file_lock.acquire(self.byte, exclusive=False)
+            self.readers += 1
+        if start is not None:
+            metrics.observe(self.wait_metric, time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    if self.file_lock is not None:
+                        self.file_lock.release(self.byte)
+                    self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        start = time.perf_counter() if metrics.enabled else None
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+        try:
+            if self.file_lock is not None:
+                self.file_lock.acquire(self.byte)
+            if start is not None:
+                metrics.observe(self.wait_metric, time.perf_counter() - start)
+            try:
+                yield
+            finally:
+                if self.file_lock is not None:
+                    self.file_lock.release(self.byte)
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
+
+
+class StripedLock:
+    # A fixed pool of locks shared out by key, so unrelated keys rarely
+    # contend and memory does not grow with the number of keys. The stripe
+    # is a CRC of the key rather than hash() so every process agrees on it.
+    def __init__(self, stripes=64, file_lock=None, first_byte=STRIPES_BYTE, name='stripe'):
+        self.locks = [ProcessLock(file_lock, first_byte + stripe, name) for stripe in range(stripes)]
+
+    def __call__(self, key):
+        return self.locks[zlib.crc32(key.encode()) % len(self.locks)]
@@ -0,0 +1,159 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+# Latency histograms and counters for the hot paths. Off until enable() is
+# called (the CLI's --metrics or --profile); until then every hook is one
+# check of `enabled`, and timed functions cost one extra call.
+#
+# A histogram has one bucket per power of two microseconds: bucket b holds
+# durations in [2**(b-1), 2**b) us, bucket 0 anything under 1us.
+BUCKETS = 32
+enabled = False
+lock = threading.Lock()
+counters = Counter()
+histograms = {}  # name -> [count, total seconds, bucket counts]
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def reset():
+    with lock:
+        counters.clear()
+        histograms.clear()
+
+
+def count(name, amount=1):
+    with lock:
+        counters[name] += amount
+
+
+def observe(name, seconds):
+    bucket = min(int(seconds * 1e6).bit_length(), BUCKETS - 1)
+    with lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = [0, 0.0, [0] * BUCKETS]
+        histogram[0] += 1
+        histogram[1] += seconds
+        histogram[2][bucket] += 1
+
+
+def timed(name):
+    # Decorator: records each call's duration under `name`.
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def timer(name):
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def bucket_limit(bucket):
+    # Upper bound of a bucket, in milliseconds.
+    return 2 ** bucket / 1000
+
+
+def percentile(buckets, total, fraction):
+    seen = 0
+    for bucket, hits in enumerate(buckets):
+        seen += hits
+        if seen >= fraction * total:
+            return bucket_limit(bucket)
+    return bucket_limit(BUCKETS - 1)
+
+
+def report_lines(width=40):
+    # Counters, then for each operation a summary and its histogram.
+    with lock:
+        counter_items = sorted(counters.items())
+        snapshot = sorted((name, count, total, list(buckets)) for name, (count, total, buckets) in histograms.items())
+    for name, value in counter_items:
+        yield f"{name:<32} {value:>14,}"
+    for name, calls, total, buckets in snapshot:
+        yield (f"\n{name}: {calls} calls, mean {total / calls * 1000:.3f} ms, "
+               f"p50 <= {percentile(buckets, calls, 0.5):g} ms, p99 <= {percentile(buckets, calls, 0.99):g} ms")
+        used = [bucket for bucket, hits in enumerate(buckets) if hits]
+        most = max(buckets)
+        for bucket in range(used[0], used[-1] + 1):
+            bar = '#' * round(buckets[bucket] / most * width)
+            yield f"  < {bucket_limit(bucket):>10g} ms {buckets[bucket]:>9} {bar}"
+
+
+class StackSampler(threading.Thread):
+    # Wall-clock sampling of every thread's stack, written in the folded
+    # format flamegraph.pl and speedscope read: "outer;...;inner count".
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        self.stopped.set()
+        self.join()
+        with open(path, 'w') as file:
+            for stack, hits in self.stacks.most_common():
+                file.write(f"{stack} {hits}\n")
+
+
+@contextmanager
+def profiled(path):
+    # Profiles the block and turns metrics on. A path ending in .folded gets
+    # sampled stacks for a flame graph; anything else cProfile stats, for
+    # pstats or snakeviz.
+    enable()
+    if path.endswith('.folded'):
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.write(path)
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
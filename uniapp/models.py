@@ -0,0 +1,124 @@
+import random
+import struct
+
+GRADES = ('Z', 'P', 'C', 'D', 'HD')
+
+class Subject:
+    __slots__ = ('number', 'score', 'grade_code')
+
+    def __init__(self):
+        # The id is picked when the subject is added to a student.
+        self.number = None
+        self.score = random.randint(25, 100)
+        self.grade_code = GRADES.index(self.determine_grade())
+
+    @classmethod
+    def restore(cls, number, score):
+        subject = cls.__new__(cls)
+        subject.number = number
+        subject.score = score
+        subject.grade_code = GRADES.index(subject.determine_grade())
+        return subject
+
+    @property
+    def id(self):
+        return str(self.number).zfill(3)
+
+    @property
+    def grade(self):
+        return GRADES[self.grade_code]
+
+    def determine_grade(self):
+        if self.score < 50:
+            return 'Z'
+        elif 50 <= self.score < 65:
+            return 'P'
+        elif 65 <= self.score < 75:
+            return 'C'
+        elif 75 <= self.score < 85:
+            return 'D'
+        elif self.score >= 85:
+            return 'HD'
+
+    def __getstate__(self):
+        return (self.number, self.score)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Pickled before __slots__: {'id': '042', 'score': .., 'grade': ..}
+            state = (int(state['id']), state['score'])
+        self.number, self.score = state
+        self.grade_code = GRADES.index(self.determine_grade())
+
+    def __str__(self):
+        return f"Subject ID: {self.id}, Score: {self.score}, Grade: {self.grade}"
+
+class Student:
+    __slots__ = ('id', 'name', 'email', 'password', 'subjects')
+
+    def __init__(self, name, email, password):
+        # Assigned by Database.register_student.
+        self.id = None
+        self.name = name
+        self.email = email
+        self.password = password
+        self.subjects = []
+
+    def __getstate__(self):
+        # Subjects are stored column-wise: uint16 ids and uint8 scores.
+        count = len(self.subjects)
+        numbers = struct.pack(f'<{count}H', *(subject.number for subject in self.subjects))
+        scores = bytes(subject.score for subject in self.subjects)
+        return (self.id, self.name, self.email, self.password, numbers, scores)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Pickled before __slots__, with a list of Subject objects.
+            for name, value in state.items():
+                setattr(self, name, value)
+            return
+        self.id, self.name, self.email, self.password, numbers, scores = state
+        numbers = struct.unpack(f'<{len(scores)}H', numbers)
+        self.subjects = [Subject.restore(number, score) for number, score in zip(numbers, scores)]
+
+    def register_subject(self):
+        new_subject = Subject()
+        if self.add_subject(new_subject):
+            print(f"Registered subject: {new_subject}")
+        else:
+            print(f"\033[31mStudent are allowed to enrol in 4 subjects only.\033[0m")
+
+    def add_subject(self, subject):
+        if len(self.subjects) >= 4:
+            return False
+        # Keep an id the subject already has if it is free here, so replaying
+        # the same enrolment against another copy gives the same id.
+        if subject.number is None or any(taken.number == subject.number for taken in self.subjects):
+            subject.number = self.free_subject_number()
+        self.subjects.append(subject)
+        return True
+
+    def free_subject_number(self):
+        # Uniform over the ids this student does not hold, without retries:
+        # draw from the free count, then step over each taken id below it.
+        taken = sorted({subject.number for subject in self.subjects})
+        number = random.randint(1, 999 - len(taken))
+        for used in taken:
+            if used <= number:
+                number += 1
+        return number
+
+    def drop_subject(self, subject_id):
+        original_length = len(self.subjects)
+        self.subjects = [subject for subject in self.subjects if subject.id != subject_id]
+        return len(self.subjects) < original_length
+
+    def list_subjects(self):
+        for subject in self.subjects:
+            print(subject)
+
+    def change_password(self, password_hash):
+        self.password = password_hash
+
+    def __str__(self):
+        return f"Student ID: {self.id}, Name: {self.name}, Email: {self.email}, Subjects: {[str(subject) for subject in self.subjects]}"
@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from collections import OrderedDict
+
+from . import metrics
+
+# Stored forms:
+#   scrypt$<n>$<r>$<p>$<salt>$<hash>
+#   pbkdf2_sha256$<iterations>$<salt>$<hash>
+# with base64 salt and hash. Anything else is a plaintext password from
+# before hashing; it still verifies, and needs_rehash() says to replace it.
+ALGORITHMS = ('scrypt', 'pbkdf2_sha256')
+DEFAULT_COST = {'scrypt': 2 ** 14, 'pbkdf2_sha256': 600_000}
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+
+def encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def is_hash(stored):
+    return stored.startswith(tuple(algorithm + '$' for algorithm in ALGORITHMS))
+
+
+def derive(password, algorithm, params, salt):
+    if algorithm == 'scrypt':
+        n, r, p = params
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=HASH_SIZE)
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params[0], dklen=HASH_SIZE)
+
+
+def parse(stored):
+    algorithm, *fields = stored.split('$')
+    params = tuple(int(field) for field in fields[:-2])
+    return algorithm, params, base64.b64decode(fields[-2]), base64.b64decode(fields[-1])
+
+
+class PasswordHasher:
+    # `cost` is scrypt's n (a power of two) or the PBKDF2 iteration count.
+    # Successful verifications are remembered in a bounded LRU keyed by a
+    # keyed digest of the password, so repeated logins skip the KDF without
+    # keeping the password itself around.
+    def __init__(self, algorithm=None, cost=None, cache_size=1024, workers=4):
+        if algorithm is None:
+            algorithm = 'scrypt' if hasattr(hashlib, 'scrypt') else 'pbkdf2_sha256'
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown password algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.params = (cost or DEFAULT_COST[algorithm],) + ((8, 1) if algorithm == 'scrypt' else ())
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.secret = os.urandom(32)
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.executor = None
+
+    @metrics.timed('passwords.hash')
+    def hash(self, password):
+        salt = os.urandom(SALT_SIZE)
+        digest = derive(password, self.algorithm, self.params, salt)
+        return '$'.join([self.algorithm, *map(str, self.params), encode(salt), encode(digest)])
+
+    def hash_many(self, passwords):
+        # The KDFs release the GIL, so a batch hashes in parallel.
+        return list(self.pool().map(self.hash, passwords))
+
+    @metrics.timed('passwords.verify')
+    def verify(self, password, stored):
+        key = (stored, hmac.digest(self.secret, password.encode(), 'sha256'))
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return True
+        if not is_hash(stored):
+            return hmac.compare_digest(stored.encode(), password.encode())
+        try:
+            algorithm, params, salt, digest = parse(stored)
+        except (ValueError, IndexError):
+            return False
+        if not hmac.compare_digest(derive(password, algorithm, params, salt), digest):
+            return False
+        with self.lock:
+            self.cache[key] = True
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return True
+
+    def verify_async(self, password, stored):
+        return self.pool().submit(self.verify, password, stored)
+
+    def needs_rehash(self, stored):
+        if not is_hash(stored):
+            return True
+        algorithm, params = parse(stored)[:2]
+        return algorithm != self.algorithm or params != self.params
+
+    def pool(self):
+        with self.lock:
+            if self.executor is None:
+                # concurrent.futures is slow to import and most runs never
+                # hash in the background.
+                from concurrent.futures import ThreadPoolExecutor
+                self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='passwords')
+            return self.executor
+
+
+hasher = PasswordHasher()
+
+
+def configure(algorithm=None, cost=None):
+    global hasher
+    hasher = PasswordHasher(algorithm, cost)
+
+
+def verify_student(database, student, password):
+    # A successful login also migrates the stored password: plaintext from
+    # before hashing, or a hash made with other settings, is replaced -
+    # unless the password changed in the meantime.
+    if not hasher.verify(password, student.password):
+        return False
+    if hasher.needs_rehash(student.password):
+        old, new = student.password, hasher.hash(password)
+        database.modify_student(student, lambda current: current.change_password(new) if current.password == old else False)
+    return True
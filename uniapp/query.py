@@ -0,0 +1,77 @@
+from itertools import islice
+
+from .models import GRADES
+from .reports import email_domain
+
+# Student queries answered from the report aggregates. Every filter is
+# checked against what the aggregates hold in memory, so only the students
+# that match are ever read from the data file.
+#
+# Candidates come from the narrowest index the filters allow: the students
+# holding a grade, those with an email domain, those with a score in range,
+# or the sorted averages. Results are in that index's order unless order_by
+# asks for 'id', 'average' or '-average'. Ordering by average leaves out
+# students with no subjects, who have no average.
+ORDERS = (None, 'id', 'average', '-average')
+
+
+def in_range(value, low, high):
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def select_ids(aggregates, grade=None, min_score=None, max_score=None, min_average=None, max_average=None,
+               domain=None, min_subjects=None, max_subjects=None, order_by=None, offset=0, limit=None):
+    if order_by not in ORDERS:
+        raise ValueError(f"Unknown order: {order_by}")
+    totals = aggregates.totals
+    sources = []  # (size, candidate ids)
+    checks = []
+    if grade is not None:
+        if grade not in GRADES:
+            raise ValueError(f"Unknown grade: {grade}")
+        students = aggregates.grade_students[GRADES.index(grade)]
+        sources.append((len(students), students))
+        checks.append(students.__contains__)
+    if domain is not None:
+        students = aggregates.domain_students.get(email_domain(domain), {})
+        sources.append((len(students), students))
+        checks.append(students.__contains__)
+    if min_score is not None or max_score is not None:
+        postings = [students for score, students in enumerate(aggregates.score_students)
+                    if students and in_range(score, min_score, max_score)]
+        if len(postings) == 1:
+            sources.append((len(postings[0]), postings[0]))
+        else:
+            # Scores are few, so a student's check is a handful of lookups;
+            # as a source the union is only built if it is the narrowest.
+            sources.append((sum(map(len, postings)), postings))
+        checks.append(lambda key: any(key in students for students in postings))
+    if min_subjects is not None or max_subjects is not None:
+        checks.append(lambda key: in_range(totals[key][1], min_subjects, max_subjects))
+    averaged = min_average is not None or max_average is not None
+    if order_by in ('average', '-average') or (averaged and not sources):
+        # The sorted averages serve the range and the order at once, and a
+        # limit stops the walk as soon as it has enough.
+        index = aggregates.averages().irange(min_average, max_average, reverse=order_by == '-average')
+        candidates = (key for average, key in index)
+    else:
+        if averaged:
+            checks.append(lambda key: totals[key][1] and in_range(totals[key][0] / totals[key][1], min_average, max_average))
+        if sources:
+            candidates = min(sources, key=lambda source: source[0])[1]
+            if isinstance(candidates, list):
+                candidates = dict.fromkeys(key for students in candidates for key in students)
+        else:
+            candidates = totals
+    matches = (key for key in candidates if all(check(key) for check in checks))
+    if order_by == 'id':
+        matches = iter(sorted(matches))
+    return list(islice(matches, offset, None if limit is None else offset + limit))
+
+
+def parse_range(text, convert=float):
+    # "low-high", "low-", "-high" or a single value, as the CLI takes them.
+    low, separator, high = text.strip().partition('-')
+    if not separator:
+        return convert(low), convert(low)
+    return (convert(low) if low.strip() else None), (convert(high) if high.strip() else None)
@@ -0,0 +1,935 @@
+import mmap
+import os
+import struct
+from bisect import bisect_left
+import threading
+import zlib
+
+from . import metrics
+from .locking import WRITE_BYTE, FileLock, ProcessLock
+
+# students.data layout:
+#   HEADER        magic, format version, table offset, table end
+#   record*       one per live key, all listed in the offset table
+#   table         two arrays of <u64 offset>, one entry per record before
+#                 it: the first sorted by the records' keys, the second by
+#                 their index keys (then offset), both as UTF-8 bytes
+#   record*       records appended since the table was written
+# A record is <u32 crc32><u32 payload len><u8 op><u16 key len><u16 index len>,
+# the key and index key (the student's email) as UTF-8, then the payload: the
+# encoded value for a PUT, nothing for a DELETE. The checksum covers
+# everything after itself. Keys sit outside the payload so the file can be
+# indexed without decoding anything. The latest record for a key wins;
+# everything older is dead until compaction.
+#
+# The records after the table are the write-ahead part: on open they are
+# replayed up to the first one that is short or fails its checksum, and
+# the rest is cut off as a torn write. A checkpoint (a compaction) folds
+# them into a new table once there are checkpoint_interval of them, so
+# recovery never replays more than that.
+MAGIC = b'STUDNT'
+VERSION = 4
+HEADER = struct.Struct('<6sHQQ')
+RECORD_HEADER = struct.Struct('<IIBHH')
+# The header past the checksum, which is all a version 2 record had.
+RECORD_FIELDS = struct.Struct('<IBHH')
+CHECKSUM = struct.Struct('<I')
+TABLE_ENTRY = struct.Struct('<Q')
+OP_PUT = 1
+OP_DELETE = 2
+# A saved aggregates snapshot is only trusted for the file whose inode and
+# leading bytes (header and offset table included) it was taken from.
+CHECK_SIZE = 65536
+
+
+def email_key(student):
+    return student.email
+
+
+def encode_record(op, key, index_key='', data=b''):
+    # data is the value already encoded by the log's codec.
+    key = key.encode()
+    index_key = index_key.encode()
+    body = RECORD_FIELDS.pack(len(data), op, len(key), len(index_key)) + key + index_key + data
+    return CHECKSUM.pack(zlib.crc32(body)) + body
+
+
+def read_record_header(source, offset):
+    # Returns (op, key, index key, payload start, record end).
+    checksum, length, op, key_length, index_length = RECORD_HEADER.unpack_from(source, offset)
+    position = offset + RECORD_HEADER.size
+    key = bytes(source[position:position + key_length]).decode()
+    position += key_length
+    index_key = bytes(source[position:position + index_length]).decode()
+    position += index_length
+    return op, key, index_key, position, position + length
+
+
+def record_keys(source, offset):
+    # The key and index key of the record at offset, as bytes.
+    key_length, index_length = RECORD_HEADER.unpack_from(source, offset)[3:]
+    position = offset + RECORD_HEADER.size
+    return source[position:position + key_length], source[position + key_length:position + key_length + index_length]
+
+
+def write_data_file(filename, records, suffix='.tmp'):
+    # records: (key, index key, encoded record) in the order to keep.
+    temp = filename + suffix
+    with open(temp, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        by_key = []
+        by_index = []
+        for key, index_key, record in records:
+            offset = file.tell()
+            by_key.append((key.encode(), offset))
+            by_index.append((index_key.encode(), offset))
+            file.write(record)
+        table_offset = file.tell()
+        for column in (by_key, by_index):
+            column.sort()
+            file.write(b''.join(TABLE_ENTRY.pack(offset) for _, offset in column))
+        table_end = file.tell()
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, table_offset, table_end))
+    return temp
+
+
+def commit(temp, filename):
+    # Atomic replace: the new file is on disk before it takes the old name,
+    # and the rename itself is on disk before we return. A crash leaves
+    # either the old file or the new one, never a torn mix.
+    with open(temp, 'rb+') as file:
+        os.fsync(file.fileno())
+    os.replace(temp, filename)
+    sync_directory(filename)
+
+
+def sync_directory(filename):
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def migrate(filename, index_key=email_key, codec=None):
+    # One-shot conversion from the old format, a single pickled list of
+    # students. The original file is kept as <filename>.bak.
+    if codec is None:
+        import pickle as codec
+    with open(filename, 'rb') as file:
+        try:
+            students = codec.loads(file.read())
+        except EOFError:
+            students = []
+    latest = {}
+    for student in students:
+        latest.pop(student.id, None)
+        latest[student.id] = student
+    temp = write_data_file(filename, [
+        (key, index_key(student), encode_record(OP_PUT, key, index_key(student), codec.dumps(student)))
+        for key, student in latest.items()
+    ])
+    # The original takes its second name before the new file takes the
+    # first, so a crash in between still leaves the roster in place.
+    backup = filename + '.bak'
+    try:
+        os.remove(backup)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(filename, backup)
+    except OSError:
+        import shutil
+        shutil.copyfile(filename, backup)
+    commit(temp, filename)
+
+
+def load_state(file):
+    # The saved aggregates are only lists, dicts and tuples of ints and
+    # strings, so no global is ever needed: refusing them all means a
+    # tampered side file cannot name something to run.
+    import pickle
+
+    class StateUnpickler(pickle.Unpickler):
+        def find_class(self, module, name):
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in an aggregates file")
+
+    return StateUnpickler(file).load()
+
+
+def upgrade(filename):
+    # Rewrites an older file in the current format: version 2 records carry
+    # no checksum, and version 3 kept its table in roster order, with the
+    # keys in it. Returns the new file, not yet committed.
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+        magic, version, table_offset, table_end = HEADER.unpack_from(source, 0)
+        fields = RECORD_FIELDS if version == 2 else RECORD_HEADER
+        latest = {}
+        position = HEADER.size
+        while True:
+            if position == table_offset:
+                position = table_end
+            if position + fields.size > len(source):
+                break
+            header = fields.unpack_from(source, position)
+            length, op, key_length, index_length = header[-4:]
+            start = position + fields.size
+            payload = start + key_length + index_length
+            if payload + length > len(source):
+                break
+            if version > 2 and zlib.crc32(source[position + CHECKSUM.size:payload + length]) != header[0]:
+                break
+            key = source[start:start + key_length].decode()
+            latest.pop(key, None)
+            if op == OP_PUT:
+                index_key = source[start + key_length:payload].decode()
+                if version > 2:
+                    record = source[position:payload + length]
+                else:
+                    record = encode_record(OP_PUT, key, index_key, source[payload:payload + length])
+                latest[key] = (index_key, record)
+            position = payload + length
+        return write_data_file(filename, [(key, index_key, record) for key, (index_key, record) in latest.items()])
+
+
+class TableColumn:
+    # One of the table's sorted offset arrays, seen by bisect as the sorted
+    # sequence of the record keys (field 0) or index keys (field 1) its
+    # offsets point at. Nothing is read until a lookup probes it.
+    def __init__(self, source, start, size, field):
+        self.source = source
+        self.start = start
+        self.size = size
+        self.field = field
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        return record_keys(self.source, self.offset(position))[self.field]
+
+    def offset(self, position):
+        return TABLE_ENTRY.unpack_from(self.source, self.start + position * TABLE_ENTRY.size)[0]
+
+    def find(self, value):
+        # Offsets of the records holding value, in file order.
+        value = value.encode()
+        position = bisect_left(self, value)
+        while position < self.size and self[position] == value:
+            yield self.offset(position)
+            position += 1
+
+
+class Offsets:
+    # key -> offset of its latest record, for every live key. Keys from
+    # before the table are found by bisecting it through `base`, a map of
+    # the file up to the table's end, which never changes; only keys
+    # written since (the tail, at most a checkpoint interval of records)
+    # are held here. Iterates in roster order: the records before the table
+    # in file order, then the keys written since in last-written order.
+    def __init__(self, base, table_offset, table_end):
+        self.base = base
+        self.table_offset = table_offset
+        size = (table_end - table_offset) // (2 * TABLE_ENTRY.size)
+        self.by_key = TableColumn(base, table_offset, size, 0)
+        self.by_index = TableColumn(base, table_offset + size * TABLE_ENTRY.size, size, 1)
+        self.changed = {}
+        # Keys from before the table written or deleted since.
+        self.shadowed = set()
+        self.count = size
+
+    def get(self, key, default=None):
+        if key in self.changed:
+            return self.changed[key]
+        if key in self.shadowed:
+            return default
+        return next(self.by_key.find(key), default)
+
+    def __getitem__(self, key):
+        offset = self.get(key)
+        if offset is None:
+            raise KeyError(key)
+        return offset
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __setitem__(self, key, offset):
+        if self.get(key) is None:
+            self.count += 1
+        # Re-inserting keeps the keys in last-written order.
+        self.changed.pop(key, None)
+        self.changed[key] = offset
+        self.shadowed.add(key)
+
+    def pop(self, key, default=None):
+        offset = self.get(key)
+        if offset is None:
+            return default
+        self.count -= 1
+        self.changed.pop(key, None)
+        self.shadowed.add(key)
+        return offset
+
+    def live(self, key, offset):
+        # Whether the record at offset is still key's latest.
+        if offset < self.table_offset:
+            return key not in self.shadowed
+        return self.changed.get(key) == offset
+
+    def items(self):
+        base = self.base
+        position = HEADER.size
+        while position < self.table_offset:
+            checksum, length, op, key_length, index_length = RECORD_HEADER.unpack_from(base, position)
+            start = position + RECORD_HEADER.size
+            key = base[start:start + key_length].decode()
+            if key not in self.shadowed:
+                yield key, position
+            position = start + key_length + index_length + length
+        yield from list(self.changed.items())
+
+    def __iter__(self):
+        return (key for key, offset in self.items())
+
+    def values(self):
+        return (offset for key, offset in self.items())
+
+
+class Index:
+    # index key -> key, kept like Offsets: the table's second array answers
+    # for records before it, the first of them in file order if several
+    # share an index key, and only changes since are held here.
+    def __init__(self, column):
+        self.column = column
+        self.added = {}
+        self.removed = set()
+
+    def get(self, index_key, default=None):
+        if index_key in self.added:
+            return self.added[index_key]
+        if index_key in self.removed:
+            return default
+        for offset in self.column.find(index_key):
+            return record_keys(self.column.source, offset)[0].decode()
+        return default
+
+    def __contains__(self, index_key):
+        return self.get(index_key) is not None
+
+    def setdefault(self, index_key, key):
+        current = self.get(index_key)
+        if current is not None:
+            return current
+        self.added[index_key] = key
+        return key
+
+    def __delitem__(self, index_key):
+        if self.added.pop(index_key, None) is None:
+            self.removed.add(index_key)
+
+
+class RecordLog:
+    def __init__(self, filename, index_key=email_key, compact_min_dead=64, compact_ratio=1.0, fsync=True,
+                 aggregates=None, codec=None, snapshots=None, checkpoint_interval=100_000, rebuild=None, file_lock=None):
+        self.filename = filename
+        # rebuild(filename, inode, keys, offsets), required with aggregates,
+        # returns fresh aggregates for those records of that file, or None
+        # if it was replaced meanwhile (see shards.build_aggregates).
+        self.rebuild = rebuild
+        # Optional snapshots.Snapshots: every file this log replaces is kept
+        # there, so any of them can be restored later; those replaced by a
+        # checkpoint only as often as the snapshots' checkpoint_interval.
+        self.snapshots = snapshots
+        self.checkpoint_interval = checkpoint_interval
+        self.tail = 0
+        # Anything with dumps(value) -> bytes and loads(bytes) -> value;
+        # pickle if not given.
+        if codec is None:
+            import pickle as codec
+        self.codec = codec
+        # Optional reports.Aggregates, snapshotted to <filename>.aggregates.
+        # They are only brought in step with the file when first needed
+        # (track_aggregates) and kept so from then on, while `tracking`.
+        self.aggregates = aggregates
+        self.tracking = False
+        self.saved = None
+        self.index_key = index_key
+        self.compact_min_dead = compact_min_dead
+        self.compact_ratio = compact_ratio
+        self.fsync = fsync
+        # `lock` guards this object's state; `write_lock` also excludes
+        # other processes and is held around every change to the file.
+        # Always take write_lock first.
+        self.lock = threading.RLock()
+        # Shared with the owner's other locks when it passes one in.
+        self.file_lock = file_lock if file_lock is not None else FileLock(filename + '.lock')
+        self.write_lock = ProcessLock(self.file_lock, WRITE_BYTE, 'write')
+        self.file = None
+        self.appended = 0
+        self.synced = 0
+        self.sync_lock = threading.Lock()
+        self.offsets = {}
+        self.index = {}
+        self.dead = 0
+        self.end = 0
+        self.stat = None
+        self.map = None
+        self.table = (HEADER.size, HEADER.size)
+        self.compactor = None
+        self.bulk = False
+        self.open()
+
+    def open(self):
+        with self.write_lock, self.lock:
+            self.check_format()
+            self.load_index()
+            self.drop_torn_tail()
+
+    def check_format(self):
+        # Caller holds write_lock. Brings an older file up to date.
+        if not os.path.exists(self.filename):
+            commit(write_data_file(self.filename, []), self.filename)
+            return
+        with open(self.filename, 'rb') as file:
+            head = file.read(HEADER.size)
+        if head[:len(MAGIC)] != MAGIC:
+            migrate(self.filename, self.index_key, self.codec)
+        elif HEADER.unpack(head)[1] < VERSION:
+            temp = upgrade(self.filename)
+            self.retire('upgrade')
+            commit(temp, self.filename)
+
+    def retire(self, reason):
+        # Caller holds write_lock. Keeps the data file as a snapshot before
+        # it is replaced; returns the snapshot's name, if one was taken.
+        if self.snapshots is None:
+            return None
+        return self.snapshots.take(self.filename, reason)
+
+    def drop_torn_tail(self):
+        # A partial record at the tail means a writer crashed mid-append.
+        # Only safe under write_lock, when no append can be in flight and
+        # the file cannot be replaced; a replacement committed before we
+        # took it is loaded first, so the cut is never made at an offset
+        # from another file. The cut goes through our own descriptor.
+        if self.replaced():
+            self.load_index()
+        if self.end < os.fstat(self.file.fileno()).st_size:
+            self.file.truncate(self.end)
+            self.remap()
+
+    def replaced(self):
+        # Whether the name now points at a file other than the one we hold.
+        return os.stat(self.filename).st_ino != self.stat.st_ino
+
+    def remap(self):
+        # The map and self.stat always come from self.file, the descriptor
+        # we append to, never from the name, which a compaction, clear or
+        # restore in another process can point at a new file at any time.
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stat = os.fstat(self.file.fileno())
+
+    @metrics.timed('log.load_index')
+    def load_index(self, keep_aggregates=False):
+        # The one place the data file is opened by name: everything else is
+        # read from this descriptor, so the index describes the file mapped.
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.filename, 'a+b')
+        self.remap()
+        magic, version, table_offset, table_end = HEADER.unpack_from(self.map, 0)
+        if version != VERSION:
+            raise ValueError(f"Unsupported data file version {version}")
+        self.table = (table_offset, table_end)
+        # Nothing of the table is read here: lookups bisect it in place.
+        self.base = mmap.mmap(self.file.fileno(), table_end, access=mmap.ACCESS_READ)
+        observe_from = None
+        if self.tracking and not keep_aggregates:
+            # Replaced under us: go on from the snapshot its writer saved,
+            # if any; otherwise the aggregates wait for their next use.
+            observe_from = self.load_aggregates()
+            self.tracking = observe_from is not None
+        self.index_tail(observe_from)
+        if self.aggregates is not None and not self.tracking and not self.offsets:
+            # An empty roster's aggregates need no rebuild.
+            self.aggregates.reset()
+            self.tracking = True
+
+    def index_tail(self, observe_from=None):
+        # Caller holds lock. Indexes the records after the table, over the
+        # table itself; those from observe_from on (none if None) update
+        # the aggregates.
+        table_offset, table_end = self.table
+        self.offsets = Offsets(self.base, table_offset, table_end)
+        self.index = Index(self.offsets.by_index)
+        self.dead = 0
+        self.tail = 0
+        self.scan(table_end, observe_from)
+
+    @metrics.timed('log.track_aggregates')
+    def track_aggregates(self):
+        # Brings the aggregates in step with the file the first time they
+        # are needed: restored from the saved snapshot and the records
+        # after it replayed, or else rebuilt without holding any lock, then
+        # the records written meanwhile replayed. Opening the log pays for
+        # neither.
+        while True:
+            with self.lock:
+                self.refresh()
+                if self.tracking:
+                    return
+                saved_end = self.load_aggregates()
+                if saved_end is not None:
+                    self.replay_aggregates(saved_end)
+                    return
+                ino, end = self.stat.st_ino, self.end
+                keys, offsets = list(self.offsets), list(self.offsets.values())
+            fresh = self.rebuild(self.filename, ino, keys, offsets)
+            with self.lock:
+                self.refresh()
+                if self.tracking:
+                    return
+                if fresh is not None and self.stat.st_ino == ino:
+                    self.aggregates.restore(fresh.state())
+                    self.replay_aggregates(end)
+                    self.save_aggregates()
+                    return
+
+    def replay_aggregates(self, end):
+        # Caller holds lock; the aggregates are the file's state at `end`.
+        self.tracking = True
+        if end < self.end:
+            self.index_tail(end)
+
+    def read_aggregates(self, read):
+        # Returns read(aggregates), called under the lock with the
+        # aggregates in step with the file.
+        while True:
+            self.track_aggregates()
+            with self.lock:
+                self.refresh()
+                if self.tracking:
+                    return read(self.aggregates)
+
+    def load_aggregates(self):
+        # Restores the saved aggregates if they belong to this file and
+        # returns the offset they are good up to; None means rebuild.
+        import pickle
+        try:
+            with open(self.filename + '.aggregates', 'rb') as file:
+                ino, end, check, state = load_state(file)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if (ino != self.stat.st_ino or end > len(self.map) or end < self.table[1]
+                or check != zlib.crc32(self.map[:min(end, CHECK_SIZE)])):
+            return None
+        try:
+            self.aggregates.restore(state)
+        except ValueError:
+            # Saved by a version that kept fewer aggregates.
+            return None
+        self.saved = (ino, end)
+        return end
+
+    def save_aggregates(self, path=None):
+        # Caller holds lock. Snapshots the aggregates as the state of `path`:
+        # the data file as far as we have read it, or a replacement file
+        # about to be committed. Only a cache, so failures are ignored.
+        if not self.tracking:
+            return
+        import pickle
+        try:
+            if path is None:
+                ino, end = self.stat.st_ino, self.end
+                check = zlib.crc32(self.map[:min(end, CHECK_SIZE)])
+            else:
+                ino, end = os.stat(path).st_ino, os.path.getsize(path)
+                with open(path, 'rb') as file:
+                    check = zlib.crc32(file.read(min(end, CHECK_SIZE)))
+            if self.saved == (ino, end):
+                return
+            temp = f'{self.filename}.aggregates.{os.getpid()}'
+            with open(temp, 'wb') as file:
+                pickle.dump((ino, end, check, self.aggregates.state()), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, self.filename + '.aggregates')
+            self.saved = (ino, end)
+        except OSError:
+            pass
+
+    def replace_aggregates(self, aggregates):
+        with self.lock:
+            self.aggregates.restore(aggregates.state())
+            self.tracking = True
+            self.saved = None
+            self.save_aggregates()
+
+    def scan(self, start, observe_from=0):
+        # Records from observe_from on (none if None) update the aggregates.
+        # Payloads are only read for their checksum. Scanning stops at the
+        # first record that is incomplete or fails it: a write in progress,
+        # or one torn by a crash, which drop_torn_tail then cuts off.
+        end = start
+        size = len(self.map)
+        scanned = 0
+        while end + RECORD_HEADER.size <= size:
+            checksum, length, op, key_length, index_length = RECORD_HEADER.unpack_from(self.map, end)
+            record_end = end + RECORD_HEADER.size + key_length + index_length + length
+            if record_end > size or zlib.crc32(self.map[end + CHECKSUM.size:record_end]) != checksum:
+                break
+            op, key, index_key, payload, record_end = read_record_header(self.map, end)
+            observe = observe_from is not None and end >= observe_from
+            if op == OP_PUT:
+                self.set_item(key, index_key, end, observe=observe)
+            else:
+                self.pop_item(key, observe)
+            end = record_end
+            scanned += 1
+        self.end = end
+        if metrics.enabled:
+            metrics.count('log.records_scanned', scanned)
+            metrics.count('log.bytes_scanned', end - start)
+
+    def set_item(self, key, index_key, offset, value=None, observe=True):
+        # Re-inserting keeps the keys in last-written order, like the old
+        # filter-and-append rewrite did.
+        previous = self.offsets.pop(key, None)
+        self.tail += 1
+        if previous is not None:
+            self.dead += 1
+            self.drop_index(key, previous)
+        self.offsets[key] = offset
+        self.index.setdefault(index_key, key)
+        if self.tracking and observe:
+            old = None if previous is None else self.read(previous)
+            self.aggregates.update(key, old, self.read(offset) if value is None else value)
+
+    def pop_item(self, key, observe=True):
+        previous = self.offsets.pop(key, None)
+        self.tail += 1
+        if previous is not None:
+            self.dead += 2
+            self.drop_index(key, previous)
+            if self.tracking and observe:
+                self.aggregates.remove(key, self.read(previous))
+
+    def drop_index(self, key, offset):
+        if offset >= len(self.map):
+            # Written earlier in the same put_many batch, not yet mapped.
+            self.file.flush()
+            self.remap()
+        index_key = read_record_header(self.map, offset)[2]
+        if self.index.get(index_key) == key:
+            del self.index[index_key]
+
+    def read(self, offset):
+        payload, record_end = read_record_header(self.map, offset)[3:]
+        if metrics.enabled:
+            metrics.count('log.bytes_read', record_end - payload)
+        return self.codec.loads(self.map[payload:record_end])
+
+    def refresh(self):
+        # Pick up records appended by another Database instance, or start
+        # over if the file was compacted or cleared under us. During
+        # put_many we hold write_lock, so nobody else can have appended and
+        # the buffered file size would only mislead us.
+        if self.bulk:
+            return
+        if self.replaced():
+            self.load_index()
+            return
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.end:
+            self.load_index()
+        elif size > self.end:
+            self.remap()
+            self.scan(self.end)
+
+    def append(self, record):
+        # Caller holds write_lock and lock.
+        self.refresh()
+        self.drop_torn_tail()
+        self.file.write(record)
+        self.file.flush()
+        offset = self.end
+        self.end += len(record)
+        self.appended += len(record)
+        if metrics.enabled:
+            metrics.count('log.bytes_written', len(record))
+        self.remap()
+        return offset
+
+    def sync(self, appended):
+        # Group commit: the first writer to get here fsyncs everything
+        # appended so far; writers that queued up behind it find their
+        # records already covered and return without another fsync.
+        if not self.fsync:
+            return
+        with self.sync_lock:
+            if self.synced >= appended:
+                return
+            with self.lock:
+                target = self.appended
+                file = self.file
+            try:
+                with metrics.timer('log.fsync'):
+                    os.fsync(file.fileno())
+            except ValueError:
+                # The file was swapped by a compaction or clear, which
+                # committed our records to the new file already.
+                pass
+            self.synced = target
+
+    def put(self, key, value):
+        # Encoding happens outside the locks; only the append is serialized.
+        index_key = self.index_key(value)
+        record = encode_record(OP_PUT, key, index_key, self.codec.dumps(value))
+        with self.write_lock, self.lock:
+            offset = self.append(record)
+            self.set_item(key, index_key, offset, value)
+            appended = self.appended
+        self.sync(appended)
+        self.maybe_compact()
+
+    def put_many(self, items):
+        # Bulk upsert of (key, value) pairs: one pass of buffered appends
+        # and a single fsync, however many records there are. Every record
+        # is encoded before the first is written, so a value the codec
+        # rejects leaves nothing of the batch behind.
+        with self.write_lock, self.lock:
+            self.refresh()
+            self.drop_torn_tail()
+            records = []
+            for key, value in items:
+                index_key = self.index_key(value)
+                records.append((key, value, index_key, encode_record(OP_PUT, key, index_key, self.codec.dumps(value))))
+            count = 0
+            start = self.appended
+            self.bulk = True
+            try:
+                for key, value, index_key, record in records:
+                    self.file.write(record)
+                    self.set_item(key, index_key, self.end, value)
+                    self.end += len(record)
+                    self.appended += len(record)
+                    count += 1
+            finally:
+                self.bulk = False
+            self.file.flush()
+            self.remap()
+            appended = self.appended
+            if metrics.enabled:
+                metrics.count('log.bytes_written', appended - start)
+        self.sync(appended)
+        self.maybe_compact()
+        return count
+
+    def delete(self, key):
+        with self.write_lock, self.lock:
+            self.refresh()
+            if key not in self.offsets:
+                return False
+            self.append(encode_record(OP_DELETE, key))
+            self.pop_item(key)
+            appended = self.appended
+        self.sync(appended)
+        self.maybe_compact()
+        return True
+
+    def get(self, key):
+        with self.lock:
+            self.refresh()
+            offset = self.offsets.get(key)
+            return None if offset is None else self.read(offset)
+
+    def get_many(self, keys):
+        # Like get() for each key, with one refresh; missing keys are skipped.
+        with self.lock:
+            self.refresh()
+            offsets = (self.offsets.get(key) for key in keys)
+            return [self.read(offset) for offset in offsets if offset is not None]
+
+    def find(self, index_key):
+        with self.lock:
+            self.refresh()
+            key = self.index.get(index_key)
+            return None if key is None else self.read(self.offsets[key])
+
+    def contains(self, key):
+        with self.lock:
+            self.refresh()
+            return key in self.offsets
+
+    def contains_index(self, index_key):
+        with self.lock:
+            self.refresh()
+            return index_key in self.index
+
+    def keys(self):
+        with self.lock:
+            self.refresh()
+            return list(self.offsets)
+
+    def values(self):
+        with self.lock:
+            self.refresh()
+            return [self.read(offset) for offset in self.offsets.values()]
+
+    def iter_values(self):
+        # Streams live values in roster order straight off the file, so the
+        # first one arrives without reading or copying the rest. A record is
+        # live while it is still the offset on record for its key, and each
+        # key is yielded once: a value rewritten after it was yielded is not
+        # yielded again. `offsets` is replaced rather than mutated when the
+        # file is reloaded; if that happens mid-scan (a compaction), the scan
+        # goes on through the new file for the keys it has not yielded yet.
+        seen = set()
+        while True:
+            with self.lock:
+                self.refresh()
+                offsets = self.offsets
+                table_offset, table_end = self.table
+                end = self.end
+                # Our own descriptor for the file `offsets` describes.
+                fd = os.dup(self.file.fileno())
+            source = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            try:
+                position = HEADER.size
+                while True:
+                    if position == table_offset:
+                        position = table_end
+                    if position >= end:
+                        with self.lock:
+                            self.refresh()
+                            if offsets is not self.offsets:
+                                break
+                            if self.end <= end:
+                                return
+                            end = self.end
+                        # Values rewritten during the scan moved to the tail.
+                        source.close()
+                        source = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+                        continue
+                    op, key, index_key, payload, record_end = read_record_header(source, position)
+                    with self.lock:
+                        live = offsets.live(key, position)
+                    if live and key not in seen:
+                        seen.add(key)
+                        if metrics.enabled:
+                            metrics.count('log.bytes_read', record_end - payload)
+                        yield self.codec.loads(source[payload:record_end])
+                    position = record_end
+            finally:
+                source.close()
+                os.close(fd)
+
+    def clear(self):
+        # Returns the name of the snapshot holding the roster as it was.
+        with self.write_lock, self.lock:
+            temp = write_data_file(self.filename, [])
+            if self.aggregates is not None:
+                # An empty roster's aggregates need no rebuild.
+                self.aggregates.reset()
+                self.tracking = True
+                self.save_aggregates(temp)
+            snapshot = self.retire('clear')
+            commit(temp, self.filename)
+            self.load_index(keep_aggregates=True)
+            return snapshot
+
+    def restore(self, path):
+        # Replaces the data file with a copy of the snapshot at `path`. The
+        # current file becomes a snapshot itself, so a restore can be undone.
+        import shutil
+        with self.write_lock, self.lock:
+            temp = self.filename + '.tmp'
+            shutil.copyfile(path, temp)
+            self.retire('restore')
+            commit(temp, self.filename)
+            self.check_format()
+            self.load_index()
+            self.drop_torn_tail()
+
+    def close(self):
+        if self.compactor is not None:
+            self.compactor.join()
+        with self.lock:
+            if self.map is not None:
+                self.save_aggregates()
+                self.map.close()
+                self.map = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.file_lock.close()
+
+    def maybe_compact(self):
+        with self.lock:
+            if ((self.dead < self.compact_min_dead or self.dead < self.compact_ratio * len(self.offsets))
+                    and self.tail < self.checkpoint_interval):
+                return
+            if self.compactor is not None and self.compactor.is_alive():
+                return
+            # Not a daemon: a short-lived process still waits for the
+            # checkpoint, so recovery never replays more than the interval.
+            self.compactor = threading.Thread(target=self.compact)
+            self.compactor.start()
+
+    def recode(self):
+        # Rewrites every live record with the log's codec, e.g. to move a
+        # file of pickled students to the binary format. Unlike a background
+        # compaction this holds write_lock throughout, so nothing gets
+        # appended in the old encoding meanwhile. Returns the record count.
+        with self.write_lock:
+            self.compact(recode=True)
+            return len(self.offsets)
+
+    @metrics.timed('log.compact')
+    def compact(self, recode=False):
+        with self.lock:
+            self.refresh()
+            ino = self.stat.st_ino
+            start = self.end
+            offsets = list(self.offsets.values())
+            # A map of its own, of the file `offsets` describes.
+            source = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Live records are copied byte for byte (or re-encoded, for recode)
+        # without holding the lock; the log is append-only, so nothing
+        # before `start` can change.
+        with source:
+            records = []
+            for offset in offsets:
+                op, key, index_key, payload, record_end = read_record_header(source, offset)
+                if recode:
+                    data = self.codec.dumps(self.codec.loads(source[payload:record_end]))
+                    records.append((key, index_key, encode_record(OP_PUT, key, index_key, data)))
+                else:
+                    records.append((key, index_key, source[offset:record_end]))
+            temp = write_data_file(self.filename, records, f'.compact.{os.getpid()}')
+        with self.write_lock, self.lock:
+            self.refresh()
+            if self.stat.st_ino != ino:
+                os.remove(temp)
+                return
+            # Carry over whatever was appended while we were writing.
+            with open(temp, 'ab') as target:
+                target.write(self.map[start:self.end])
+            # Same contents, so the aggregates carry over as they are.
+            self.save_aggregates(temp)
+            # A compaction only drops dead records, so the roster it
+            # replaces is the one it commits; it is kept only as a
+            # point-in-time snapshot, when one is due.
+            if recode:
+                self.retire('convert')
+            elif self.snapshots is not None and self.snapshots.checkpoint_due():
+                self.retire('checkpoint')
+            commit(temp, self.filename)
+            self.load_index(keep_aggregates=True)
@@ -0,0 +1,368 @@
+import math
+from array import array
+from bisect import bisect_left, insort
+from itertools import groupby, islice
+
+from .models import GRADES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PASS_MARK = 50
+CHUNK_SIZE = 1024
+REPORT_BATCH_SIZE = 256
+SCORES = 256
+INDEX_BLOCK = 512
+
+
+def email_domain(email):
+    return email.rpartition('@')[2].lower()
+
+
+class Roster:
+    # Column-wise view of the students for the admin reports: one row per
+    # enrolment, with the owning student's row alongside. Rows of the same
+    # student are contiguous and in roster order. Uses NumPy when it is
+    # installed and plain arrays otherwise.
+    def __init__(self, students):
+        self.students = list(students)
+        student_rows = array('I')
+        scores = array('B')
+        grades = array('B')
+        self.starts = array('I', [0])
+        for row, student in enumerate(self.students):
+            subjects = student.subjects
+            student_rows.extend([row] * len(subjects))
+            scores.extend([subject.score for subject in subjects])
+            grades.extend([subject.grade_code for subject in subjects])
+            self.starts.append(len(scores))
+        if np is not None:
+            self.student_rows = np.frombuffer(student_rows, dtype=np.uint32)
+            self.scores = np.frombuffer(scores, dtype=np.uint8)
+            self.grades = np.frombuffer(grades, dtype=np.uint8)
+        else:
+            self.student_rows = student_rows
+            self.scores = scores
+            self.grades = grades
+
+    def grade_rows(self, code):
+        # Enrolment rows with the given grade, in roster order.
+        if np is not None:
+            return np.flatnonzero(self.grades == code)
+        return [row for row, grade in enumerate(self.grades) if grade == code]
+
+    def by_student(self, rows):
+        # Yields (student row, enrolment rows) for the given enrolment rows.
+        if np is not None:
+            owners = self.student_rows[rows]
+            bounds = [0] + (np.flatnonzero(np.diff(owners)) + 1).tolist() + [len(rows)]
+            owners = owners.tolist()
+            rows = rows.tolist()
+            for start, stop in zip(bounds, bounds[1:]):
+                if start < stop:
+                    yield owners[start], rows[start:stop]
+            return
+        for owner, group in groupby(rows, key=self.student_rows.__getitem__):
+            yield owner, list(group)
+
+    def averages(self):
+        # Per-student enrolment counts and mean scores (NaN with no subjects).
+        count = len(self.students)
+        if np is not None:
+            counts = np.bincount(self.student_rows, minlength=count)
+            sums = np.bincount(self.student_rows, weights=self.scores, minlength=count)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return counts, sums / counts
+        counts = [0] * count
+        sums = [0] * count
+        for row, score in zip(self.student_rows, self.scores):
+            counts[row] += 1
+            sums[row] += score
+        return counts, [total / n if n else float('nan') for total, n in zip(sums, counts)]
+
+    def pass_rows(self):
+        # Passing and failing student rows in roster order, plus the means.
+        counts, means = self.averages()
+        if np is not None:
+            passed = (counts > 0) & (means >= PASS_MARK)
+            return np.flatnonzero(passed), np.flatnonzero(~passed), means
+        passed = [n > 0 and mean >= PASS_MARK for n, mean in zip(counts, means)]
+        return ([row for row, ok in enumerate(passed) if ok],
+                [row for row, ok in enumerate(passed) if not ok], means)
+
+
+class SortedIndex:
+    # (value, id) pairs kept sorted in blocks of up to 2 * INDEX_BLOCK, so
+    # adding or removing one moves a block's worth of entries rather than
+    # the whole index.
+    def __init__(self, items=()):
+        items = sorted(items)
+        self.blocks = [items[start:start + INDEX_BLOCK] for start in range(0, len(items), INDEX_BLOCK)]
+        self.maxes = [block[-1] for block in self.blocks]
+
+    def __len__(self):
+        return sum(len(block) for block in self.blocks)
+
+    def add(self, item):
+        if not self.blocks:
+            self.blocks.append([item])
+            self.maxes.append(item)
+            return
+        index = min(bisect_left(self.maxes, item), len(self.blocks) - 1)
+        block = self.blocks[index]
+        insort(block, item)
+        self.maxes[index] = block[-1]
+        if len(block) > 2 * INDEX_BLOCK:
+            self.blocks[index:index + 1] = [block[:INDEX_BLOCK], block[INDEX_BLOCK:]]
+            self.maxes[index:index + 1] = [block[INDEX_BLOCK - 1], block[-1]]
+
+    def remove(self, item):
+        index = bisect_left(self.maxes, item)
+        block = self.blocks[index]
+        del block[bisect_left(block, item)]
+        if block:
+            self.maxes[index] = block[-1]
+        else:
+            del self.blocks[index]
+            del self.maxes[index]
+
+    def irange(self, low=None, high=None, reverse=False):
+        # Items with low <= value <= high, ascending or descending. Yields
+        # lazily, so a caller that stops early only walks what it took.
+        start = None if low is None else (low,)
+        stop = None if high is None else (math.nextafter(high, math.inf),)
+        if reverse:
+            index = len(self.blocks) - 1 if stop is None else min(bisect_left(self.maxes, stop), len(self.blocks) - 1)
+            for index in range(index, -1, -1):
+                block = self.blocks[index]
+                for position in range((len(block) if stop is None else bisect_left(block, stop)) - 1, -1, -1):
+                    if start is not None and block[position] < start:
+                        return
+                    yield block[position]
+                stop = None
+        else:
+            index = 0 if start is None else bisect_left(self.maxes, start)
+            for index in range(index, len(self.blocks)):
+                block = self.blocks[index]
+                for position in range(0 if start is None else bisect_left(block, start), len(block)):
+                    if stop is not None and block[position] >= stop:
+                        return
+                    yield block[position]
+                start = None
+
+
+class Aggregates:
+    # Report totals kept up to date one write at a time: enrolments per
+    # grade, which students hold each grade, each student's score sum and
+    # count, and who passes or fails. A rewritten student is taken out and
+    # put back at the end of every dict, so they all iterate in roster
+    # (last-written) order, the same order the record log keeps.
+    #
+    # The same writes keep the secondary indexes queries use: who holds
+    # each score and who has each email domain, and once a query has asked
+    # for it, every student's average in sorted order.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.grade_counts = [0] * len(GRADES)
+        self.grade_students = [{} for _ in GRADES]  # id -> enrolments with the grade
+        self.totals = {}  # id -> (score sum, enrolments)
+        self.passing = {}
+        self.failing = {}
+        self.score_students = [{} for _ in range(SCORES)]  # id -> enrolments with the score
+        self.domain_students = {}  # domain -> {id: None}
+        self.by_average = None
+
+    def update(self, key, old, new):
+        if old is not None:
+            self.remove(key, old)
+        if new is not None:
+            self.add(key, new)
+
+    def add(self, key, student):
+        total = 0
+        for subject in student.subjects:
+            self.grade_counts[subject.grade_code] += 1
+            students = self.grade_students[subject.grade_code]
+            students[key] = students.get(key, 0) + 1
+            total += subject.score
+            students = self.score_students[subject.score]
+            students[key] = students.get(key, 0) + 1
+        count = len(student.subjects)
+        self.totals[key] = (total, count)
+        if count and total >= PASS_MARK * count:
+            self.passing[key] = None
+        else:
+            self.failing[key] = None
+        domain = email_domain(student.email)
+        students = self.domain_students.get(domain)
+        if students is None:
+            students = self.domain_students[domain] = {}
+        students[key] = None
+        if self.by_average is not None and count:
+            self.by_average.add((total / count, key))
+
+    def remove(self, key, student):
+        for subject in student.subjects:
+            self.grade_counts[subject.grade_code] -= 1
+            self.score_students[subject.score].pop(key, None)
+        for students in self.grade_students:
+            students.pop(key, None)
+        total, count = self.totals.pop(key)
+        self.passing.pop(key, None)
+        self.failing.pop(key, None)
+        domain = email_domain(student.email)
+        students = self.domain_students[domain]
+        del students[key]
+        if not students:
+            del self.domain_students[domain]
+        if self.by_average is not None and count:
+            self.by_average.remove((total / count, key))
+
+    def extend(self, keys, columns):
+        # Appends the students of one shard, given as shard_columns() of
+        # them, after everyone already here. Their keys must be new.
+        sums, counts, grades, scores, domains = columns
+        for code, column in enumerate(grades):
+            students = self.grade_students[code]
+            for key, enrolments in zip(keys, column):
+                if enrolments:
+                    students[key] = enrolments
+            self.grade_counts[code] += sum(column)
+        for key, student_scores in zip(keys, scores):
+            for score in student_scores:
+                students = self.score_students[score]
+                students[key] = students.get(key, 0) + 1
+        for key, domain in zip(keys, domains):
+            self.domain_students.setdefault(domain, {})[key] = None
+        self.totals.update(zip(keys, zip(sums, counts)))
+        for key, total, count in zip(keys, sums, counts):
+            if count and total >= PASS_MARK * count:
+                self.passing[key] = None
+            else:
+                self.failing[key] = None
+
+    def average(self, key):
+        total, count = self.totals[key]
+        return total / count if count else None
+
+    def averages(self):
+        # The sorted (average, id) index, built on first use and kept up to
+        # date from then on. Students without subjects have no average.
+        if self.by_average is None:
+            self.by_average = SortedIndex((total / count, key) for key, (total, count) in self.totals.items() if count)
+        return self.by_average
+
+    def state(self):
+        return (self.grade_counts, self.grade_students, self.totals, self.passing, self.failing,
+                self.score_students, self.domain_students)
+
+    def restore(self, state):
+        (self.grade_counts, self.grade_students, self.totals, self.passing, self.failing,
+         self.score_students, self.domain_students) = state
+        self.by_average = None
+
+    @classmethod
+    def rebuild(cls, keyed_students):
+        # From scratch over (key, student) pairs in roster order, through
+        # the columnar Roster rather than add(), so a check compares two
+        # independent computations.
+        aggregates = cls()
+        keyed_students = iter(keyed_students)
+        while True:
+            chunk = list(islice(keyed_students, CHUNK_SIZE))
+            if not chunk:
+                return aggregates
+            keys = [key for key, student in chunk]
+            roster = Roster(student for key, student in chunk)
+            for code in range(len(GRADES)):
+                students = aggregates.grade_students[code]
+                for row, rows in roster.by_student(roster.grade_rows(code)):
+                    students[keys[row]] = len(rows)
+                    aggregates.grade_counts[code] += len(rows)
+            counts, means = roster.averages()
+            for row, key in enumerate(keys):
+                count = int(counts[row])
+                scores = roster.scores[roster.starts[row]:roster.starts[row + 1]].tolist()
+                aggregates.totals[key] = (sum(scores), count)
+                if count and means[row] >= PASS_MARK:
+                    aggregates.passing[key] = None
+                else:
+                    aggregates.failing[key] = None
+                for score in scores:
+                    students = aggregates.score_students[score]
+                    students[key] = students.get(key, 0) + 1
+                domain = email_domain(roster.students[row].email)
+                aggregates.domain_students.setdefault(domain, {})[key] = None
+
+    def differences(self, other):
+        # What disagrees with `other`, order included; empty when they match.
+        found = []
+        if self.grade_counts != other.grade_counts:
+            found.append(f"grade counts {self.grade_counts} != {other.grade_counts}")
+        for code, grade in enumerate(GRADES):
+            if list(self.grade_students[code].items()) != list(other.grade_students[code].items()):
+                found.append(f"students with grade {grade} differ")
+        for name in ('totals', 'passing', 'failing'):
+            if list(getattr(self, name).items()) != list(getattr(other, name).items()):
+                found.append(f"{name} differ")
+        for score in range(SCORES):
+            if list(self.score_students[score].items()) != list(other.score_students[score].items()):
+                found.append(f"students with score {score} differ")
+        if ({domain: list(students) for domain, students in self.domain_students.items()}
+                != {domain: list(students) for domain, students in other.domain_students.items()}):
+            found.append("email domains differ")
+        return found
+
+
+def shard_columns(students):
+    # What Aggregates.extend needs, one entry per student in order: score
+    # sums, enrolment counts, per grade enrolments with that grade, the
+    # scores themselves and the email domain. Plain arrays, bytes and
+    # strings, so a worker process sends them back cheaply.
+    sums = array('I')
+    counts = array('B')
+    grades = [array('B') for _ in GRADES]
+    scores = []
+    domains = []
+    for student in students:
+        per_grade = [0] * len(GRADES)
+        total = 0
+        for subject in student.subjects:
+            per_grade[subject.grade_code] += 1
+            total += subject.score
+        sums.append(total)
+        counts.append(len(student.subjects))
+        for column, enrolments in zip(grades, per_grade):
+            column.append(enrolments)
+        scores.append(bytes(subject.score for subject in student.subjects))
+        domains.append(email_domain(student.email))
+    return sums, counts, grades, scores, domains
+
+
+def page(lines, offset=0, limit=None):
+    return islice(lines, offset, None if limit is None else offset + limit)
+
+
+def report_students(database, select, offset=0, limit=None):
+    # The reports read who belongs where from the Database's aggregates and
+    # load only the students they show, REPORT_BATCH_SIZE at a time.
+    student_ids = database.report_ids(select, offset, limit)
+    for start in range(0, len(student_ids), REPORT_BATCH_SIZE):
+        yield from database.get_many(student_ids[start:start + REPORT_BATCH_SIZE])
+
+
+def write_paged(lines, page_size=None, prompt=None):
+    # Prints lines as they are produced, pausing after every page_size lines.
+    # Returns the number of lines written, or None if the reader quit.
+    written = 0
+    for line in lines:
+        if page_size and written and written % page_size == 0:
+            if (prompt or input)("-- More: Enter to continue, Q to stop -- ").upper() == 'Q':
+                return None
+        print(line)
+        written += 1
+    return written
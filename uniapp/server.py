@@ -0,0 +1,309 @@
+import asyncio
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from . import metrics, passwords
+from .models import GRADES, Student, Subject
+from .reports import report_students
+from .validation import valid_email, valid_password
+
+# A local HTTP/1.1 JSON API over one Database. Connections are kept alive
+# (and requests may be pipelined) until the client sends Connection: close
+# or stays idle for IDLE_TIMEOUT seconds. Every POST endpoint also takes a
+# JSON array of up to MAX_BATCH request bodies and answers with an array of
+# {"status": .., "body": ..}, running the items side by side.
+#
+# A login token lasts until logout, until it goes unused for
+# SESSION_TIMEOUT seconds, or until MAX_SESSIONS later sessions push it out.
+#
+#   POST /register     {name, email, password}          -> 201 {student}
+#   POST /login        {email, password}                -> {token, student}
+#   POST /logout       {token}
+#   POST /enrol        {token}                          -> 201 {subject}
+#   POST /drop         {token, subject_id}
+#   GET  /students     ?offset=&limit=                  -> {students}
+#   GET  /students/query  ?grade=&min_score=&max_score=&min_average=
+#                         &max_average=&domain=&min_subjects=
+#                         &max_subjects=&order=&offset=&limit= -> {students}
+#   GET  /reports/grades     ?offset=&limit=            -> {grade: [student]}
+#   GET  /reports/pass-fail  ?offset=&limit=            -> {passed, failed}
+#
+# Errors come back as {"error": message} with a 4xx or 5xx status.
+IDLE_TIMEOUT = 30
+MAX_BODY = 16 * 1024 * 1024
+MAX_BATCH = 100
+SESSION_TIMEOUT = 30 * 60
+MAX_SESSIONS = 10_000
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def subject_json(subject):
+    return {'id': subject.id, 'score': subject.score, 'grade': subject.grade}
+
+
+def student_json(student, subjects=None):
+    return {'id': student.id, 'name': student.name, 'email': student.email,
+            'subjects': [subject_json(subject) for subject in (student.subjects if subjects is None else subjects)]}
+
+
+def averaged_json(student):
+    row = student_json(student)
+    scores = [subject.score for subject in student.subjects]
+    row['average'] = round(sum(scores) / len(scores), 2) if scores else None
+    return row
+
+
+def field(body, name):
+    value = body.get(name) if isinstance(body, dict) else None
+    if not isinstance(value, str):
+        raise ApiError(400, f"'{name}' is required")
+    return value
+
+
+def paging(query):
+    try:
+        offset = int(query.get('offset', 0))
+        limit = int(query['limit']) if 'limit' in query else None
+    except ValueError:
+        raise ApiError(400, "offset and limit must be integers")
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ApiError(400, "offset and limit must not be negative")
+    return offset, limit
+
+
+class Api:
+    # The endpoints. They block on the Database and the password KDF, so the
+    # server runs them on its worker threads; the Database is thread-safe.
+    def __init__(self, database):
+        self.database = database
+        # token -> (student id, last used), least recently used first.
+        self.sessions = OrderedDict()
+        self.sessions_lock = threading.Lock()
+        routes = {
+            ('POST', '/register'): self.register,
+            ('POST', '/login'): self.login,
+            ('POST', '/logout'): self.logout,
+            ('POST', '/enrol'): self.enrol,
+            ('POST', '/drop'): self.drop,
+            ('GET', '/students'): self.list_students,
+            ('GET', '/students/query'): self.query_students,
+            ('GET', '/reports/grades'): self.grade_report,
+            ('GET', '/reports/pass-fail'): self.pass_fail_report,
+        }
+        self.routes = {key: metrics.timed(f'api.{route.__name__}')(route) for key, route in routes.items()}
+
+    def session_student(self, body):
+        token = field(body, 'token')
+        with self.sessions_lock:
+            self.expire_sessions()
+            student_id = self.sessions.get(token, (None, None))[0]
+            if student_id is not None:
+                self.sessions[token] = (student_id, time.monotonic())
+                self.sessions.move_to_end(token)
+        student = None if student_id is None else self.database.get_by_id(student_id)
+        if student is None:
+            raise ApiError(401, "Not logged in")
+        return student
+
+    def register(self, body, query):
+        name, email, password = field(body, 'name'), field(body, 'email'), field(body, 'password')
+        if not valid_email(email):
+            raise ApiError(400, "Invalid email format")
+        if not valid_password(password):
+            raise ApiError(400, "Invalid password format")
+        if self.database.email_exists(email):
+            raise ApiError(409, f"A student {name} already exists")
+        student = Student(name, email, passwords.hasher.hash(password))
+        if not self.database.register_student(student):
+            raise ApiError(409, f"A student {name} already exists")
+        return 201, {'student': student_json(student)}
+
+    def login(self, body, query):
+        email, password = field(body, 'email'), field(body, 'password')
+        student = self.database.get_by_email(email)
+        if student is None or not passwords.verify_student(self.database, student, password):
+            raise ApiError(401, "Incorrect email or password")
+        token = secrets.token_urlsafe(24)
+        with self.sessions_lock:
+            self.sessions[token] = (student.id, time.monotonic())
+            self.expire_sessions()
+        return 200, {'token': token, 'student': student_json(student)}
+
+    def logout(self, body, query):
+        with self.sessions_lock:
+            self.sessions.pop(field(body, 'token'), None)
+        return 200, {}
+
+    def expire_sessions(self):
+        # Caller holds sessions_lock. Drops the idle sessions, and the least
+        # recently used ones beyond MAX_SESSIONS.
+        now = time.monotonic()
+        while self.sessions:
+            token, (student_id, used) = next(iter(self.sessions.items()))
+            if now - used < SESSION_TIMEOUT and len(self.sessions) <= MAX_SESSIONS:
+                break
+            del self.sessions[token]
+
+    def enrol(self, body, query):
+        student = self.session_student(body)
+        subject = Subject()
+        if not self.database.modify_student(student, lambda current: current.add_subject(subject)):
+            raise ApiError(409, "Students are allowed to enrol in 4 subjects only")
+        return 201, {'subject': subject_json(subject)}
+
+    def drop(self, body, query):
+        student = self.session_student(body)
+        subject_id = field(body, 'subject_id')
+        if not self.database.modify_student(student, lambda current: current.drop_subject(subject_id)):
+            raise ApiError(404, f"Subject {subject_id} not found")
+        return 200, {'student': student_json(student)}
+
+    def list_students(self, body, query):
+        offset, limit = paging(query)
+        students = self.database.get_many(self.database.student_ids(offset, limit))
+        return 200, {'students': [student_json(student) for student in students]}
+
+    def query_students(self, body, query):
+        offset, limit = paging(query)
+        filters = {'grade': query.get('grade'), 'domain': query.get('domain'), 'order_by': query.get('order')}
+        for name, convert in (('score', int), ('average', float), ('subjects', int)):
+            for bound in (f'min_{name}', f'max_{name}'):
+                try:
+                    filters[bound] = convert(query[bound]) if bound in query else None
+                except ValueError:
+                    raise ApiError(400, f"{bound} must be a number")
+        try:
+            students = self.database.query(offset=offset, limit=limit, **filters)
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        return 200, {'students': [averaged_json(student) for student in students]}
+
+    def grade_report(self, body, query):
+        offset, limit = paging(query)
+        report = {}
+        for code, grade in enumerate(GRADES):
+            students = report_students(self.database, lambda aggregates: aggregates.grade_students[code], offset, limit)
+            report[grade] = [student_json(student, [subject for subject in student.subjects if subject.grade_code == code])
+                             for student in students]
+        return 200, report
+
+    def pass_fail_report(self, body, query):
+        offset, limit = paging(query)
+        report = {}
+        for name, select in (('passed', lambda aggregates: aggregates.passing),
+                             ('failed', lambda aggregates: aggregates.failing)):
+            report[name] = [averaged_json(student) for student in report_students(self.database, select, offset, limit)]
+        return 200, report
+
+
+class Server:
+    def __init__(self, database, workers=8):
+        self.api = Api(database)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='api')
+
+    async def call(self, route, body, query):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, route, body, query)
+        except ApiError as e:
+            return e.status, {'error': e.message}
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        route = self.api.routes.get((method, url.path))
+        if route is None:
+            if any(path == url.path for _, path in self.api.routes):
+                return 405, {'error': f"{method} is not allowed on {url.path}"}
+            return 404, {'error': f"No endpoint {url.path}"}
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            body = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {'error': "Request body is not valid JSON"}
+        if isinstance(body, list):
+            if len(body) > MAX_BATCH:
+                return 413, {'error': f"A batch holds at most {MAX_BATCH} requests"}
+            results = await asyncio.gather(*(self.call(route, item, query) for item in body))
+            return 200, [{'status': status, 'body': result} for status, result in results]
+        return await self.call(route, body, query)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {'error': "Malformed request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                if 'chunked' in headers.get('transfer-encoding', ''):
+                    await self.respond(writer, 411, {'error': "Send a Content-Length"}, False)
+                    break
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY:
+                    await self.respond(writer, 413, {'error': f"Body must be at most {MAX_BODY} bytes"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.dispatch(method, target, body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        data = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + data)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{server.sockets[0].getsockname()[1]}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+def serve(database, host='127.0.0.1', port=8765, workers=8):
+    try:
+        asyncio.run(Server(database, workers).serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        database.close()
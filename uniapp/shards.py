@@ -0,0 +1,59 @@
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import codec
+from .recordlog import read_record_header
+from .reports import Aggregates, shard_columns
+
+# Rebuilding the report aggregates from scratch means decoding every
+# student, which is what takes the time on a large roster. The live records
+# are cut into contiguous shards in roster order, byte ranges of the data
+# file, and each shard is decoded and totted up in its own process. Merging
+# appends the shards in order, so the result iterates exactly as a serial
+# rebuild would.
+#
+# Workers are spawned rather than forked: the parent has lock and I/O
+# threads running, which a fork would copy mid-flight.
+MIN_SHARD = 50_000
+
+
+def read_shard(filename, ino, offsets):
+    # The shard's columns (see shard_columns), or None if the name no
+    # longer points at the file with inode `ino`: the offsets would be
+    # another file's.
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_ino != ino:
+            return None
+        source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    with source:
+        def students():
+            for offset in offsets:
+                payload, record_end = read_record_header(source, offset)[3:]
+                yield codec.loads(source[payload:record_end])
+        return shard_columns(students())
+
+
+def build_aggregates(filename, ino, keys, offsets, workers=None):
+    # Aggregates for the records at `offsets` (keyed by `keys`, in roster
+    # order) of the file with inode `ino`, or None if the file was replaced
+    # meanwhile. A roster too small to be worth the processes is read here.
+    workers = min(workers or os.cpu_count() or 1, len(offsets) // MIN_SHARD)
+    if workers < 2:
+        columns = read_shard(filename, ino, offsets)
+        if columns is None:
+            return None
+        aggregates = Aggregates()
+        aggregates.extend(keys, columns)
+        return aggregates
+    bounds = [len(offsets) * shard // workers for shard in range(workers + 1)]
+    aggregates = Aggregates()
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(read_shard, filename, ino, offsets[start:stop]) for start, stop in zip(bounds, bounds[1:])]
+        for start, stop, future in zip(bounds, bounds[1:], futures):
+            columns = future.result()
+            if columns is None:
+                return None
+            aggregates.extend(keys[start:stop], columns)
+    return aggregates
@@ -0,0 +1,67 @@
+import os
+import time
+
+# Point-in-time copies of the data file. The record log never changes a
+# file it has replaced (clear, convert, restore all commit a new one),
+# so a retired file is the whole roster as it stood at that moment and can
+# be kept by hard-linking it here, without copying anything.
+#   <data file>.snapshots/<YYYYmmdd-HHMMSS-micro>-<reason>.data
+#
+# Checkpoints (compactions) keep one too, at most every checkpoint_interval
+# seconds, so the roster can be taken back to a recent point in time. They
+# rotate on their own, and never push out the copies kept by a clear,
+# convert or restore.
+CHECKPOINT = 'checkpoint'
+
+
+class Snapshots:
+    def __init__(self, directory, keep=8, keep_checkpoints=8, checkpoint_interval=3600):
+        self.directory = directory
+        self.keep = keep
+        self.keep_checkpoints = keep_checkpoints
+        self.checkpoint_interval = checkpoint_interval
+
+    def take(self, filename, reason):
+        # Caller holds the log's write_lock, so the file cannot grow while
+        # it is linked. Returns the snapshot's name.
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1e6) % 1000000:06d}-{reason}"
+        path = self.path(name)
+        try:
+            os.link(filename, path)
+        except OSError:
+            # No hard links here (another file system, say): copy instead.
+            import shutil
+            shutil.copyfile(filename, path)
+        checkpoint = reason == CHECKPOINT
+        rotation = [name for name in self.names() if self.is_checkpoint(name) == checkpoint]
+        for old in rotation[:-(self.keep_checkpoints if checkpoint else self.keep)]:
+            try:
+                os.remove(self.path(old))
+            except OSError:
+                pass
+        return name
+
+    def checkpoint_due(self):
+        # Whether the last checkpoint snapshot is checkpoint_interval old.
+        taken = [name for name in self.names() if self.is_checkpoint(name)]
+        if not taken:
+            return True
+        when = time.mktime(time.strptime(taken[-1][:len('YYYYmmdd-HHMMSS')], '%Y%m%d-%H%M%S'))
+        return time.time() - when >= self.checkpoint_interval
+
+    @staticmethod
+    def is_checkpoint(name):
+        return name.endswith('-' + CHECKPOINT)
+
+    def names(self):
+        # Oldest first.
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(file[:-len('.data')] for file in files if file.endswith('.data'))
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.data')
@@ -0,0 +1,14 @@
+import re
+
+from . import metrics
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._]*[a-zA-Z0-9]+\.[a-zA-Z0-9]+@[a-zA-Z0-9._]+\.[a-zA-Z]{2,}$')
+PASSWORD_PATTERN = re.compile(r'^[A-Z][a-zA-Z]{4,}[0-9]{3,}$')
+
+@metrics.timed('validation.valid_email')
+def valid_email(email):
+    return EMAIL_PATTERN.match(email) and email.endswith('@university.com')
+
+@metrics.timed('validation.valid_password')
+def valid_password(password):
+    return PASSWORD_PATTERN.match(password)
@@ -0,0 +1,62 @@
+import threading
+
+# How long a session's changes may live only in memory:
+#   sync   every change is written (and fsynced) before returning
+#   batch  written after `max_pending` changes, `interval` seconds, or logout
+#   lazy   written after `max_pending` changes or logout; a crash mid-session
+#          loses whatever is pending
+DURABILITY_MODES = ('sync', 'batch', 'lazy')
+
+
+class WriteBehindCache:
+    # Stands in for the Database during a student session. Changes apply to
+    # the session's copy at once and are queued per student id; a flush
+    # replays all of a student's queued changes against the latest stored
+    # copy in one Database.modify_student call, so a session costs one
+    # record write per flush instead of one per action, and concurrent
+    # sessions still do not overwrite each other. Changes must therefore be
+    # deterministic (create the Subject before queuing its enrolment).
+    def __init__(self, database, durability='batch', max_pending=8, interval=5.0):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.database = database
+        self.durability = durability
+        self.max_pending = max_pending
+        self.interval = interval
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.count = 0
+        self.timer = None
+
+    def modify_student(self, student, change):
+        with self.lock:
+            result = change(student)
+            if result is False:
+                return result
+            entry = self.pending.setdefault(student.id, (student, []))
+            entry[1].append(change)
+            self.count += 1
+            if self.durability == 'sync' or self.count >= self.max_pending:
+                self.flush()
+            elif self.durability == 'batch' and self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        return result
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            pending, self.pending, self.count = self.pending, {}, 0
+            for student, changes in pending.values():
+                self.database.modify_student(student, lambda current: replay(current, changes))
+
+    def close(self):
+        self.flush()
+
+
+def replay(student, changes):
+    for change in changes:
+        change(student)